@@ -0,0 +1,88 @@
+from phoneme_parser import TextSynthesis, TextBlocks
+from transcription import get_phoneme_parser
+from collections import Counter
+import argparse
+import json
+
+
+def get_first_difference(picks, exhaustive_picks):
+    for iteration, (index, exhaustive_index) in enumerate(zip(picks, exhaustive_picks)):
+        if index != exhaustive_index:
+            return iteration
+    return None if len(picks) == len(exhaustive_picks) else min(len(picks), len(exhaustive_picks))
+
+
+def run(text_analyzer, params, **selection):
+    text_synth = TextSynthesis(text=None, text_analyzer=text_analyzer, **dict(params, **selection))
+    text_synth.synthesis()
+    seconds = text_synth.run_time.total_seconds()
+    return text_synth, {
+        'iterations_number': text_synth.iterations_number,
+        'run_time': seconds,
+        'iterations_per_second': text_synth.iterations_number / seconds if seconds else None,
+        'test_p_value_level': text_synth.test_p_value_level,
+        'result_words': text_synth.get_results()['result_words'],
+    }
+
+
+def benchmark(text_analyzer, params, refreshes, full_refresh):
+    """
+    Runs synthesis with exhaustive selection and with lazy selection for each refresh value, and compares picked
+    chunks of lazy runs to exhaustive ones.
+    :return: dict of results
+    """
+    exhaustive, exhaustive_results = run(text_analyzer, params, selection=TextSynthesis.SELECTION_EXHAUSTIVE)
+    exhaustive_picks = Counter(exhaustive.picked_chunks)
+    results = {'parameters': params, 'exhaustive': exhaustive_results, 'lazy': []}
+    for refresh in refreshes:
+        lazy, lazy_results = run(
+            text_analyzer, params, selection=TextSynthesis.SELECTION_LAZY, lazy_refresh=refresh,
+            lazy_full_refresh=full_refresh
+        )
+        lazy_picks = Counter(lazy.picked_chunks)
+        common = sum((lazy_picks & exhaustive_picks).values())
+        all_picks = sum((lazy_picks | exhaustive_picks).values())
+        lazy_results.update({
+            'refresh': refresh,
+            'full_refresh': full_refresh,
+            # multiset Jaccard similarity of picked chunks, 1 - same selection
+            'selection_similarity': common / all_picks if all_picks else 1,
+            'first_different_iteration': get_first_difference(lazy.picked_chunks, exhaustive.picked_chunks),
+            'speedup': (
+                lazy_results['iterations_per_second'] / exhaustive_results['iterations_per_second']
+                if lazy_results['iterations_per_second'] and exhaustive_results['iterations_per_second'] else None
+            ),
+        })
+        results['lazy'].append(lazy_results)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compares lazy and exhaustive chunk selection')
+    parser.add_argument('--mode', dest='mode', default='sentence', help='Sets paring mode (word or sentence). Default: sentence')
+    parser.add_argument('--compare', dest='compare', default='pvalue', help='Sets compare method (pvalue or statistics). Default: pvalue')
+    parser.add_argument('--pvalue', type=float, dest='pvalue', default=0.7, help='Sets pvalue. Default: 0.7')
+    parser.add_argument('--method', dest='method', default='append', help='Sets synthes method (append or delete). Default: append')
+    parser.add_argument('--group', type=int, dest='group', default=1, help='Sets size of phoneme groups. Default: 1')
+    parser.add_argument('--file', dest='file', default='app/file.txt', help='Sets file to read from initial text. Default: app/file.txt')
+    parser.add_argument('--refresh', type=int, nargs='+', dest='refresh', default=[1, 16, 128], help='Sets lazy refresh values to compare. Default: 1 16 128')
+    parser.add_argument('--full-refresh', type=int, dest='full_refresh', default=0, help='Sets lazy full refresh period. Default: 0')
+    parser.add_argument('--output', dest='output', default=None, help='Sets JSON file to save results to')
+    parser.add_argument('--parser', dest='parser', default='espeak', help='Sets how new words are transcribed (espeak or http). Default: espeak')
+
+    args = parser.parse_args()
+    phoneme_parser = get_phoneme_parser(args.parser)
+    params = {
+        'mode': TextSynthesis.WORD if args.mode == 'word' else TextSynthesis.SENTENCE,
+        'distribution_criteria': TextSynthesis.PVALUE if args.compare == 'pvalue' else TextSynthesis.STATISTIC,
+        'p_value_level': args.pvalue,
+        'synthesis_mode': args.method,
+        'phoneme_group_size': args.group,
+    }
+    text_analyzer = TextSynthesis.analyze(TextBlocks(args.file), phoneme_parser, args.group)
+
+    results = json.dumps(benchmark(text_analyzer, params, args.refresh, args.full_refresh), indent=2)
+    print(results)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(results)
@@ -0,0 +1,71 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+# modules each CLI path imports before it starts working, in import order; main imports phoneme_parser only when there
+# is no cached result
+CLI_PATHS = {
+    'main --report false': ['text_blocks', 'transcription', 'metrics', 'result_cache'],
+    'main': ['text_blocks', 'transcription', 'metrics', 'result_cache', 'export'],
+    'main synthesis': ['text_blocks', 'transcription', 'metrics', 'result_cache', 'phoneme_parser'],
+    'main --parser http': ['text_blocks', 'transcription', 'metrics', 'result_cache', 'export', 'http_transcription'],
+    'script': ['export', 'phoneme_parser', 'transcription'],
+    'corpus_stats': ['phoneme_parser', 'transcription'],
+    'service': ['lexicon', 'phoneme_parser', 'transcription', 'http.server'],
+    'import_phonemes': ['lexicon'],
+}
+# third party modules that should be loaded only by the paths that use them
+HEAVY_MODULES = ('numpy', 'scipy.sparse', 'scipy.stats', 'requests', 'bs4', 'xlsxwriter')
+
+MEASURE = '''
+import sys, time, json
+sys.path.insert(0, {app_dir!r})
+start = time.perf_counter()
+for module in {modules!r}:
+    __import__(module)
+seconds = time.perf_counter() - start
+print(json.dumps({{'seconds': seconds, 'loaded': [m for m in {heavy!r} if m in sys.modules]}}))
+'''
+
+
+def measure_path(modules, repeat):
+    """
+    Imports modules in a new interpreter repeat times.
+    :return: dict with best and mean seconds of imports and heavy modules that were loaded
+    """
+    runs = []
+    for _ in range(repeat):
+        code = MEASURE.format(app_dir=APP_DIR, modules=modules, heavy=HEAVY_MODULES)
+        output = subprocess.check_output([sys.executable, '-c', code], cwd=APP_DIR)
+        runs.append(json.loads(output.decode('utf-8').strip().split('\n')[-1]))
+    times = [run['seconds'] for run in runs]
+    return {
+        'seconds': min(times),
+        'mean_seconds': sum(times) / len(times),
+        'repeat': repeat,
+        'loaded': runs[-1]['loaded'],
+    }
+
+
+def run(paths, repeat):
+    return {name: measure_path(CLI_PATHS[name], repeat) for name in paths}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measures import time of every CLI path')
+    parser.add_argument('--paths', nargs='+', dest='paths', default=list(CLI_PATHS), help='Sets CLI paths to measure. Default: all of them')
+    parser.add_argument('--repeat', type=int, dest='repeat', default=5, help='Sets number of interpreters started for each path. Default: 5')
+    parser.add_argument('--output', dest='output', default=None, help='Sets JSON file to save results to. Default: results are only printed')
+
+    args = parser.parse_args()
+    results = run(args.paths, args.repeat)
+    for name, result in results.items():
+        print('{:<25} {:>8.4f} {}'.format(name, result['seconds'], ' '.join(result['loaded'])))
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2, sort_keys=True)
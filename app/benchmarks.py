@@ -0,0 +1,218 @@
+from phoneme_parser import TextSynthesis, TextBlocks, SavedPhonemeWords, PhonemeVocabulary, Word
+import argparse
+import datetime
+import itertools
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+
+
+FILES = ('app/file.txt', 'app/The_Waxwork-Alfred_Burrage.txt', 'app/Airport-Arthur_Hailey.txt')
+LEXICON_FILES = ('saved_phonemes.json', 'app/dump.json')
+MODES = (TextSynthesis.WORD, TextSynthesis.SENTENCE)
+CRITERIAS = (TextSynthesis.PVALUE, TextSynthesis.STATISTIC)
+SYNTHESIS_MODES = (TextSynthesis.SYNTHESIS_APPEND, TextSynthesis.SYNTHESIS_DELETE)
+PHONEME_GROUP_SIZES = (1, 2, 3)
+BOOKKEEPING_PICKS = 100000
+
+
+class OfflinePhonemeParser:
+    """
+    Parser for benchmarks, so espeak or network is never used. Words that are not in the lexicon get their letters as
+    transcription, which is deterministic, so every run analyzes the same phonemes.
+    """
+    def __init__(self):
+        self.missing_words = 0
+
+    def words_to_phonemes(self, words):
+        self.missing_words += len(words)
+        for word in words:
+            yield word, word
+
+
+def use_offline_lexicon(directory):
+    """
+    Points SavedPhonemeWords to a new sqlite file in directory, filled from LEXICON_FILES.
+    """
+    SavedPhonemeWords.FILE_NAME = os.path.join(directory, 'saved_phonemes.sqlite3')
+    for file_name in LEXICON_FILES:
+        if os.path.isfile(file_name):
+            SavedPhonemeWords.import_json(file_name)
+
+
+def measure(function, repeat):
+    """
+    :return: dict with best and mean seconds of repeat calls of function
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return {'seconds': min(times), 'mean_seconds': sum(times) / len(times), 'repeat': repeat}
+
+
+def benchmark_parse_phonemes_dict(text_analyzer, repeat):
+    """
+    Time of Word.parse_phonemes_dict of every word of text. Words are made before timing, as Word parses its
+    transcription in __init__ too.
+    """
+    vocabulary = PhonemeVocabulary()
+    words = [Word(word.text, word.transcription, vocabulary, 3) for word in text_analyzer.words.values()]
+
+    def parse():
+        for word in words:
+            word.parse_phonemes_dict(3)
+
+    return dict(measure(parse, repeat), words=len(words))
+
+
+def benchmark_text_analyzer(file_name, phoneme_parser, repeat):
+    return measure(lambda: TextSynthesis.analyze(TextBlocks(file_name), phoneme_parser, 3), repeat)
+
+
+def benchmark_chunk_picks(text_analyzer, repeat, modes):
+    """
+    Time of one get_best_chunk (first iteration of append) and one get_worst_chunk (first iteration of delete).
+    """
+    results = {}
+    for mode, group_size in itertools.product(modes, PHONEME_GROUP_SIZES):
+        text_synth = TextSynthesis(text=None, text_analyzer=text_analyzer, mode=mode, phoneme_group_size=group_size)
+        candidates = text_synth._get_candidates(text_synth.chunks_multiplicity)
+        empty_counts = text_synth.count_vectors.empty()
+        name = '{}_{}'.format(mode, group_size)
+        results['get_best_chunk_' + name] = dict(
+            measure(lambda: text_synth.get_best_chunk(empty_counts, candidates), repeat), candidates=len(candidates)
+        )
+        results['get_worst_chunk_' + name] = dict(
+            measure(lambda: text_synth.get_worst_chunk(text_synth.initial_counts, candidates), repeat),
+            candidates=len(candidates)
+        )
+    return results
+
+
+def benchmark_bookkeeping(text_analyzer, repeat, modes):
+    """
+    Time of chunks bookkeeping without scoring: removing first BOOKKEEPING_PICKS chunks of text one by one from
+    remaining counts with the candidates update of each iteration, and writing delete mode result text with half of
+    chunks removed.
+    """
+    results = {}
+    for mode in modes:
+        text_synth = TextSynthesis(
+            text=None, text_analyzer=text_analyzer, mode=mode, synthesis_mode=TextSynthesis.SYNTHESIS_DELETE
+        )
+        picks = text_synth.chunks_rows[:BOOKKEEPING_PICKS].tolist()
+
+        def remove_chunks():
+            remaining = text_synth.chunks_multiplicity.copy()
+            for index in picks:
+                remaining[index] -= 1
+                text_synth._get_candidates(remaining)
+
+        removed = text_synth.chunks_multiplicity // 2
+        results['remove_chunks_' + mode] = dict(measure(remove_chunks, repeat), picks=len(picks))
+        results['remaining_text_' + mode] = dict(
+            measure(lambda: text_synth._get_remaining_text(removed), repeat), chunks=len(text_synth.chunks_rows)
+        )
+    return results
+
+
+def benchmark_synthesis(text_analyzer, p_value_level, max_iterations, modes):
+    results = {}
+    for mode, criteria, synthesis_mode, group_size in itertools.product(
+            modes, CRITERIAS, SYNTHESIS_MODES, PHONEME_GROUP_SIZES
+    ):
+        text_synth = TextSynthesis(
+            text=None, text_analyzer=text_analyzer, mode=mode, distribution_criteria=criteria,
+            synthesis_mode=synthesis_mode, phoneme_group_size=group_size, p_value_level=p_value_level,
+            max_iterations=max_iterations
+        )
+        start = time.perf_counter()
+        text_synth.synthesis()
+        seconds = time.perf_counter() - start
+        results['synthesis_{}_{}_{}_{}'.format(mode, synthesis_mode, criteria, group_size)] = {
+            'seconds': seconds,
+            'iterations_number': text_synth.iterations_number,
+            'iterations_per_second': text_synth.iterations_number / seconds if seconds else None,
+            'test_p_value_level': text_synth.test_p_value_level,
+            'budget_exhausted': text_synth.budget_exhausted,
+        }
+    return results
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).strip().decode('utf-8')
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(files, repeat, p_value_level, max_iterations, synthesis=True, modes=MODES):
+    phoneme_parser = OfflinePhonemeParser()
+    results = {}
+    for file_name in files:
+        name = os.path.splitext(os.path.basename(file_name))[0]
+        text_analyzer = TextSynthesis.analyze(TextBlocks(file_name), phoneme_parser, 3)
+        file_results = {
+            'words': text_analyzer.tokens_number,
+            'parse_phonemes_dict': benchmark_parse_phonemes_dict(text_analyzer, repeat),
+            'text_analyzer': benchmark_text_analyzer(file_name, phoneme_parser, repeat),
+        }
+        file_results.update(benchmark_chunk_picks(text_analyzer, repeat, modes))
+        file_results.update(benchmark_bookkeeping(text_analyzer, repeat, modes))
+        if synthesis:
+            file_results.update(benchmark_synthesis(text_analyzer, p_value_level, max_iterations, modes))
+        results[name] = file_results
+    return {
+        'commit': get_commit(),
+        'date': datetime.datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'parameters': {
+            'repeat': repeat, 'p_value_level': p_value_level, 'max_iterations': max_iterations, 'modes': list(modes)
+        },
+        'missing_words': phoneme_parser.missing_words,
+        'results': results,
+    }
+
+
+def compare(results, baseline):
+    """
+    Prints seconds of every benchmark against baseline results.
+    """
+    for file_name, file_results in sorted(results['results'].items()):
+        for name, result in sorted(file_results.items()):
+            base = baseline['results'].get(file_name, {}).get(name)
+            if not isinstance(base, dict) or not base['seconds']:
+                continue
+            print('{:<40} {:<50} {:>10.4f} {:>10.4f} {:>7.2f}x'.format(
+                file_name, name, base['seconds'], result['seconds'], result['seconds'] / base['seconds']
+            ))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks text analysis and synthesis with offline lexicon')
+    parser.add_argument('--files', nargs='+', dest='files', default=list(FILES), help='Sets text files. Default: ' + ' '.join(FILES))
+    parser.add_argument('--repeat', type=int, dest='repeat', default=3, help='Sets number of runs of each micro benchmark. Default: 3')
+    parser.add_argument('--pvalue', type=float, dest='pvalue', default=0.7, help='Sets pvalue of synthesis benchmarks. Default: 0.7')
+    parser.add_argument('--max-iterations', type=int, dest='max_iterations', default=None, help='Sets max iterations of synthesis benchmarks. Default: no limit')
+    parser.add_argument('--modes', nargs='+', dest='modes', default=list(MODES), help='Sets synthesis modes to benchmark (word, sentence). Default: word sentence')
+    parser.add_argument('--no-synthesis', dest='synthesis', action='store_false', help='Skips end-to-end synthesis benchmarks')
+    parser.add_argument('--output', dest='output', default='benchmarks.json', help='Sets JSON file to save results to. Default: benchmarks.json')
+    parser.add_argument('--compare', dest='compare', default=None, help='Sets JSON results of another commit to compare with')
+
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        use_offline_lexicon(directory)
+        results = run(args.files, args.repeat, args.pvalue, args.max_iterations, args.synthesis, args.modes)
+
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare, "r") as file:
+            compare(results, json.load(file))
@@ -0,0 +1,58 @@
+from phoneme_parser import CorpusStatistics, TextSynthesis, TextBlocks
+from transcription import get_phoneme_parser
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import json
+
+
+def analyze_shard(file_name, phoneme_group_size, parser_name):
+    phoneme_parser = get_phoneme_parser(parser_name)
+    text_analyzer = TextSynthesis.analyze(TextBlocks(file_name), phoneme_parser, phoneme_group_size, keep_order=False)
+    return CorpusStatistics.from_analyzer(text_analyzer)
+
+
+def analyze(args):
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        statistics_list = list(executor.map(
+            analyze_shard, args.files, [args.group] * len(args.files), [args.parser] * len(args.files)
+        ))
+    CorpusStatistics.merge(statistics_list).save(args.output)
+
+
+def merge(args):
+    CorpusStatistics.merge([CorpusStatistics.load(file_name) for file_name in args.files]).save(args.output)
+
+
+def show(args):
+    statistics = CorpusStatistics.load(args.file)
+    print(json.dumps({
+        'phoneme_group_size': statistics.phoneme_group_size,
+        'initial_words': statistics.tokens_number,
+        'unique_words': len(statistics.words),
+        'initial_distribution': statistics.get_initial_percentage()
+    }, indent=2, sort_keys=True, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Analyzes text shards and merges their statistics')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    analyze_parser = subparsers.add_parser('analyze', help='Analyzes text files in parallel and saves merged statistics')
+    analyze_parser.add_argument('files', nargs='+', help='Text files, shards of one text')
+    analyze_parser.add_argument('--output', dest='output', required=True, help='Sets statistics file to save, e.g. stats.npz')
+    analyze_parser.add_argument('--group', type=int, dest='group', default=3, help='Sets max size of phoneme groups. Default: 3')
+    analyze_parser.add_argument('--workers', type=int, dest='workers', default=None, help='Sets number of processes to analyze files. Default: number of CPUs')
+    analyze_parser.add_argument('--parser', dest='parser', default='espeak', help='Sets how new words are transcribed (espeak or http). Default: espeak')
+    analyze_parser.set_defaults(run=analyze)
+
+    merge_parser = subparsers.add_parser('merge', help='Merges saved statistics of shards')
+    merge_parser.add_argument('files', nargs='+', help='Statistics files')
+    merge_parser.add_argument('--output', dest='output', required=True, help='Sets statistics file to save, e.g. stats.npz')
+    merge_parser.set_defaults(run=merge)
+
+    show_parser = subparsers.add_parser('show', help='Prints statistics and initial distribution as JSON')
+    show_parser.add_argument('file', help='Statistics file')
+    show_parser.set_defaults(run=show)
+
+    args = parser.parse_args()
+    args.run(args)
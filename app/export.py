@@ -1,6 +1,8 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from metrics import metrics
+import gzip
 import json
-import xlsxwriter
 import os
 
 
@@ -11,57 +13,119 @@ PHONEMES_NUM = {
 }
 
 
-class JSONExport:
+def get_phonemes_num(phoneme_group_size):
+    return PHONEMES_NUM.get(phoneme_group_size, '{}-grams'.format(phoneme_group_size))
 
-    def __init__(self, data, file_name=None):
-        self.data = data
-        phonemes_num = PHONEMES_NUM[data['phoneme_group_size']]
-        self.file_name = file_name or 'reports/synthesis_by_{}_{}_by_{}_{}_{}.json'.format(data['mode'], data['synthesis_mode'], data['criteria'], phonemes_num, datetime.now())
 
-    def save(self):
-        dir_name = os.path.dirname(self.file_name)
-        if not os.path.isdir(dir_name):
-            try:
-                os.makedirs(dir_name)
-            except OSError:
-                pass  # who cares
+def make_dirs(file_name):
+    dir_name = os.path.dirname(file_name)
+    if dir_name and not os.path.isdir(dir_name):
+        try:
+            os.makedirs(dir_name)
+        except OSError:
+            pass  # who cares
 
-        file = open(self.file_name, "w")
-        file.write(json.dumps(self.data, indent=2, sort_keys=True))
-        file.close()
 
+class Export:
+    """
+    Base class of reports. Result text is not written to the report, but to a separate gzip file next to it, which
+    is named in report.
+    """
+    EXTENSION = None
 
-class SpreadsheetExport:
-    def __init__(self, data, file_name=None):
+    def __init__(self, data, file_name=None, answer_file_name=None, save_answer=True):
+        """
+        :param data: dict of TextSynthesis.get_results
+        :param file_name: string, report file. Default: reports/synthesis_by_... file
+        :param answer_file_name: string, result text file. Default: report file name with .answer.txt.gz extension
+        :param save_answer: bool, if result text file should be written, False when another report of the same
+        results writes it
+        """
         self.data = data
-        phonemes_num = PHONEMES_NUM[data['phoneme_group_size']]
-        self.file_name = file_name or 'reports/synthesis_by_{}_{}_by_{}_{}.xlsx'.format(data['mode'], data['synthesis_mode'], data['criteria'], phonemes_num, datetime.now())
+        self.file_name = file_name or self.get_default_file_name()
+        self.answer_file_name = answer_file_name or os.path.splitext(self.file_name)[0] + '.answer.txt.gz'
+        self.save_answer = save_answer
+
+    def get_default_file_name(self):
+        raise NotImplementedError
+
+    def get_summary(self):
+        """
+        :return: data without result text, with name of result text file instead
+        """
+        summary = {key: value for key, value in self.data.items() if key != 'answer'}
+        summary['answer_file'] = os.path.basename(self.answer_file_name)
+        return summary
 
     def save(self):
-        dir_name = os.path.dirname(self.file_name)
-        if not os.path.isdir(dir_name):
-            try:
-                os.makedirs(dir_name)
-            except OSError:
-                pass  # who cares
-
-        workbook = xlsxwriter.Workbook(self.file_name)
+        with metrics.timer('export'):
+            make_dirs(self.file_name)
+            if self.save_answer:
+                with gzip.open(self.answer_file_name, "wt", encoding='utf-8') as answer_file:
+                    answer_file.write(self.data['answer'] or '')
+            self._save()
+
+    def _save(self):
+        raise NotImplementedError
+
+
+class JSONExport(Export):
+    EXTENSION = 'json'
+
+    def get_default_file_name(self):
+        phonemes_num = get_phonemes_num(self.data['phoneme_group_size'])
+        return 'reports/synthesis_by_{}_{}_by_{}_{}_{}.{}'.format(self.data['mode'], self.data['synthesis_mode'], self.data['criteria'], phonemes_num, datetime.now(), self.EXTENSION)
+
+    def _save(self):
+        # json.dump writes encoded chunks one by one, the whole document is never built in memory
+        with open(self.file_name, "w") as file:
+            json.dump(self.get_summary(), file, indent=2, sort_keys=True)
+
+
+class JSONLinesExport(Export):
+    """
+    Appends results as one line of JSON to file, so results of many runs are kept in one file.
+    """
+    EXTENSION = 'jsonl'
+
+    def get_default_file_name(self):
+        return 'reports/synthesis.' + self.EXTENSION
+
+    def _save(self):
+        with open(self.file_name, "a") as file:
+            json.dump(self.get_summary(), file, sort_keys=True)
+            file.write('\n')
+
+
+class SpreadsheetExport(Export):
+    """
+    Writes report with xlsxwriter constant memory mode, rows are written in order and flushed to disk one by one.
+    """
+    EXTENSION = 'xlsx'
+
+    def get_default_file_name(self):
+        phonemes_num = get_phonemes_num(self.data['phoneme_group_size'])
+        return 'reports/synthesis_by_{}_{}_by_{}_{}.{}'.format(self.data['mode'], self.data['synthesis_mode'], self.data['criteria'], phonemes_num, self.EXTENSION)
+
+    def _save(self):
+        import xlsxwriter
+
+        workbook = xlsxwriter.Workbook(self.file_name, {'constant_memory': True})
         worksheet = workbook.add_worksheet()
 
         worksheet.write(0, 0, 'Mode:')
         worksheet.write(0, 1, self.data['mode'])
-
         worksheet.write(0, 3, 'Synthesis:')
         worksheet.write(0, 4, self.data['synthesis_mode'])
 
         worksheet.write(1, 0, 'Criteria:')
         worksheet.write(1, 1, self.data['criteria'])
-
         worksheet.write(1, 3, 'P Value:')
         worksheet.write(1, 4, str(self.data['p_value_level']))
-
         worksheet.write(1, 5, 'Result P Value:')
         worksheet.write(1, 6, self.data['test_p_value_level'])
+        worksheet.write(1, 7, 'phoneme_group_size:')
+        worksheet.write(1, 8, get_phonemes_num(self.data['phoneme_group_size']))
 
         worksheet.write(2, 0, 'Initial words:')
         worksheet.write(2, 1, self.data['initial_words'])
@@ -71,44 +135,33 @@ class SpreadsheetExport:
 
         worksheet.write(4, 0, 'Running time:')
         worksheet.write(4, 1, self.data['run_time'])
-
         worksheet.write(4, 3, 'Iterations:')
         worksheet.write(4, 4, self.data['iterations_number'])
 
         worksheet.write(5, 0, 'Date:')
         worksheet.write(5, 1, self.data['date'])
 
-        worksheet.write(1, 7, 'phoneme_group_size:')
-        worksheet.write(1, 8, PHONEMES_NUM[self.data['phoneme_group_size']])
-
         worksheet.write(7, 0, 'Initial distribution:')
-        chart1 = workbook.add_chart({'type': 'column'})
-        chart1.set_size({'width': 1200, 'height': 800})
+        worksheet.write(7, 4, 'Result distribution:')
         row = 8
-        col = 0
         for key in sorted(self.data['initial_distribution'].keys()):
-            worksheet.write(row, col, key)
-            worksheet.write(row, col + 1, self.data['initial_distribution'][key] * 100)
+            worksheet.write(row, 0, key)
+            worksheet.write(row, 1, self.data['initial_distribution'][key] * 100)
+            worksheet.write(row, 4, key)
+            worksheet.write(row, 5, self.data['result_distribution'].get(key, 0) * 100)
             row += 1
 
+        chart1 = workbook.add_chart({'type': 'column'})
+        chart1.set_size({'width': 1200, 'height': 800})
         chart1.add_series({
             'name': ['Sheet1', 7, 0],
-            'categories': ['Sheet1', 8, col, row, col],
-            'values': ['Sheet1', 8, col + 1, row, col + 1],
+            'categories': ['Sheet1', 8, 0, row, 0],
+            'values': ['Sheet1', 8, 1, row, 1],
         })
-
-        worksheet.write(7, 4, 'Result distribution:')
-        row = 8
-        col = 4
-        for key in sorted(self.data['initial_distribution'].keys()):
-            worksheet.write(row, col, key)
-            worksheet.write(row, col + 1, self.data['result_distribution'].get(key, 0) * 100)
-            row += 1
-
         chart1.add_series({
             'name': ['Sheet1', 7, 4],
-            'categories': ['Sheet1', 8, col, row, col],
-            'values': ['Sheet1', 8, col + 1, row, col + 1],
+            'categories': ['Sheet1', 8, 4, row, 4],
+            'values': ['Sheet1', 8, 5, row, 5],
         })
 
         # Add a chart title and some axis labels.
@@ -123,6 +176,43 @@ class SpreadsheetExport:
         worksheet.insert_chart('I8', chart1, {'x_offset': 25, 'y_offset': 10})
 
         worksheet.write(row + 2, 0, 'Answer')
-        worksheet.insert_textbox(row + 3, 0, self.data['answer'], {'x_scale': 3, 'y_scale': 3})
+        worksheet.write(row + 2, 1, os.path.basename(self.answer_file_name))
 
         workbook.close()
+
+
+class ReportWriter:
+    """
+    Class that saves reports on a background thread, so the next synthesis starts while reports are written. Reports
+    are saved one by one in submit order. Errors are raised by close.
+    """
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.futures = []
+
+    def submit(self, function, *args):
+        """
+        :param function: function that saves reports, called on the background thread
+        :return: Future of function result
+        """
+        future = self.executor.submit(function, *args)
+        self.futures.append(future)
+        return future
+
+    def save(self, *exports):
+        self.submit(lambda: [export.save() for export in exports])
+
+    def close(self):
+        """
+        Waits for all reports to be saved.
+        """
+        self.executor.shutdown(wait=True)
+        for future in self.futures:
+            future.result()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
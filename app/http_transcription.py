@@ -0,0 +1,83 @@
+from concurrent.futures import ThreadPoolExecutor
+from bs4 import BeautifulSoup
+import requests
+import time
+
+
+class HttpPhonemeParser:
+    """
+    Class that gets transcription for given text from http.
+    Words are sent in batches of BATCH_SIZE words, several requests are sent at once over one pool of connections.
+    """
+    AVAILABLE_LANGUAGES = ('english', 'danish', 'german')
+    DEFAULT_LANGUAGE = 'english'
+    ALPHABET = 'IPA'
+    URL2 = 'http://upodn.com/phon.php'
+    USER_AGENT = 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/57.0.2987.133 Safari/537.36'
+    BATCH_SIZE = 500
+    WORKERS = 4
+    RETRIES = 3
+    BACKOFF = 0.5
+    TIMEOUT = 60
+
+    def __init__(self, language=None, url=None, workers=None):
+        self.language = language if language in self.AVAILABLE_LANGUAGES else self.DEFAULT_LANGUAGE
+        self.url = url or self.URL2
+        self.workers = workers or self.WORKERS
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = self.USER_AGENT
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def text_to_phoneme(self, text):
+        """
+        Gets text and returns it's transcription. Only first 500 words will get translations.
+        :param text: string
+        :return: string, transcription
+        """
+        html_doc = self._get_html(text)
+        soup = BeautifulSoup(html_doc, 'html.parser')
+        return soup.find_all('td')[1].find('font').text.strip()
+
+    def words_to_phonemes(self, words):
+        """
+        Gets transcriptions of words. Words are sent in batches of BATCH_SIZE words, several requests at once.
+        :param words: list of words
+        :return: generator of tuples (word, phoneme), batch by batch
+        """
+        batches = [words[i:i + self.BATCH_SIZE] for i in range(0, len(words), self.BATCH_SIZE)]
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for batch, phonemes in zip(batches, executor.map(self._batch_to_phonemes, batches)):
+                for word, phoneme in zip(batch, phonemes):
+                    yield word, phoneme
+
+    def _batch_to_phonemes(self, words):
+        """
+        Gets transcriptions of batch of words with one request. If transcription can't be split to the words, every
+        word is transcribed separately.
+        :param words: list of not empty words
+        :return: list of phonemes in words order
+        """
+        phonemes = self.text_to_phoneme(' '.join(words)).split()
+        if len(phonemes) != len(words):
+            return [self.text_to_phoneme(word) for word in words]
+        return phonemes
+
+    def _get_html(self, text):
+        """
+        Posts text, retries with growing delay on connection errors and server errors.
+        :param text: string
+        :return: string, html
+        """
+        request = {'intext': text, 'ipa': 0}
+        for attempt in range(self.RETRIES + 1):
+            try:
+                res = self.session.post(self.url, request, timeout=self.TIMEOUT)
+                res.raise_for_status()
+                return res.text
+            except requests.RequestException as e:
+                status_code = e.response.status_code if e.response is not None else None
+                if attempt == self.RETRIES or (status_code is not None and status_code < 500):
+                    raise
+                time.sleep(self.BACKOFF * 2 ** attempt)
@@ -0,0 +1,15 @@
+from lexicon import SavedPhonemeWords
+import argparse
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Imports words and their phonemes from JSON files to saved phonemes')
+    parser.add_argument('files', nargs='+', help='JSON files with {"word": "phoneme"} dict, e.g. saved_phonemes.json app/dump.json')
+    parser.add_argument('--db', dest='db', default=SavedPhonemeWords.FILE_NAME, help='Sets saved phonemes file. Default: ' + SavedPhonemeWords.FILE_NAME)
+
+    args = parser.parse_args()
+    SavedPhonemeWords.FILE_NAME = args.db
+
+    for file_name in args.files:
+        words_number = SavedPhonemeWords.import_json(file_name)
+        print('{}: {} words'.format(file_name, words_number))
@@ -0,0 +1,116 @@
+import json
+import os
+import sqlite3
+
+
+class SavedPhonemeWords:
+    """
+    Class that saves/gets words and theirs phonemes to/from sqlite file.
+    Words are looked up and inserted in batches, every update is a separate transaction, so several processes can
+    share one file and an interrupted run keeps all words saved before.
+    After load_memory, every saved word is also kept in memory and only words that are not there are looked up in file,
+    for long running processes.
+    """
+    FILE_NAME = "saved_phonemes.sqlite3"
+    JSON_FILE_NAME = "saved_phonemes.json"
+    BATCH_SIZE = 500
+    TIMEOUT = 60
+    memory = None
+
+    @classmethod
+    def load_memory(cls):
+        """
+        Loads every saved word to memory.
+        :return: int, number of words
+        """
+        connection = cls.connect()
+        try:
+            cls.memory = dict(connection.execute('SELECT word, phoneme FROM phonemes'))
+        finally:
+            connection.close()
+        return len(cls.memory)
+
+    @classmethod
+    def connect(cls):
+        """
+        Opens sqlite file, creates table if needed. Words from JSON_FILE_NAME are imported when the table is created.
+        :return: sqlite3.Connection
+        """
+        connection = sqlite3.connect(cls.FILE_NAME, timeout=cls.TIMEOUT)
+        connection.execute('PRAGMA journal_mode=WAL')
+        with connection:
+            created = not connection.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'phonemes'"
+            ).fetchone()
+            connection.execute('CREATE TABLE IF NOT EXISTS phonemes (word TEXT PRIMARY KEY, phoneme TEXT NOT NULL)')
+        if created and os.path.isfile(cls.JSON_FILE_NAME):
+            cls._insert(connection, cls.read_json(cls.JSON_FILE_NAME), replace=False)
+        return connection
+
+    @classmethod
+    def get(cls, words):
+        """
+        Gets saved phonemes of words
+        :param words: list of words
+        :return: dict {'word': 'phoneme'} of words that are saved
+        """
+        saved_phoneme_words = dict()
+        if cls.memory is not None:
+            saved_phoneme_words = {word: cls.memory[word] for word in words if word in cls.memory}
+            words = [word for word in words if word not in saved_phoneme_words]
+            if not words:
+                return saved_phoneme_words
+        connection = cls.connect()
+        try:
+            for i in range(0, len(words), cls.BATCH_SIZE):
+                batch = words[i:i + cls.BATCH_SIZE]
+                rows = connection.execute(
+                    'SELECT word, phoneme FROM phonemes WHERE word IN ({})'.format(', '.join('?' * len(batch))), batch
+                )
+                saved_phoneme_words.update(rows)
+        finally:
+            connection.close()
+        return saved_phoneme_words
+
+    @classmethod
+    def update(cls, phoneme_words):
+        """
+        Saves words and their phonemes. Words that are already saved are replaced.
+        :param phoneme_words: dict {'word': 'phoneme'} to be saved
+        """
+        if not phoneme_words:
+            return
+        connection = cls.connect()
+        try:
+            cls._insert(connection, phoneme_words)
+        finally:
+            connection.close()
+        if cls.memory is not None:
+            cls.memory.update(phoneme_words)
+
+    @classmethod
+    def import_json(cls, file_name):
+        """
+        Saves words from JSON file with {'word': 'phoneme'} dict, like the old saved_phonemes.json or dump.json.
+        Words that are already saved are kept.
+        :param file_name: string, path to JSON file
+        :return: int, number of words in file
+        """
+        phoneme_words = cls.read_json(file_name)
+        connection = cls.connect()
+        try:
+            cls._insert(connection, phoneme_words, replace=False)
+        finally:
+            connection.close()
+        return len(phoneme_words)
+
+    @staticmethod
+    def read_json(file_name):
+        with open(file_name, "r") as words_file:
+            return json.load(words_file)
+
+    @staticmethod
+    def _insert(connection, phoneme_words, replace=True):
+        statement = 'INSERT OR {} INTO phonemes (word, phoneme) VALUES (?, ?)'.format('REPLACE' if replace else 'IGNORE')
+        with connection:
+            connection.executemany(statement, phoneme_words.items())
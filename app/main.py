@@ -1,9 +1,14 @@
-from phoneme_parser import TextSynthesis
-from export import SpreadsheetExport
+from text_blocks import TextBlocks
+from transcription import get_phoneme_parser
+from metrics import metrics
+from result_cache import ResultCache
 import argparse
+import json
 
 SENTENCE = 'sentence'
 WORD = 'word'
+PVALUE = 'pvalue'
+STATISTIC = 'statistic'
 
 
 if __name__ == '__main__':
@@ -12,19 +17,73 @@ if __name__ == '__main__':
     parser.add_argument('--compare', dest='compare', default='pvalue', help='Sets compare method (pvalue or statistics). Default: pvalue')
     parser.add_argument('--pvalue', type=float, dest='pvalue', default=0.7, help='Sets pvalue. Default: 0.7')
     parser.add_argument('--method', dest='method', default='append', help='Sets synthes method (append or delete). Default: append')
+    parser.add_argument('--group', type=int, dest='group', default=1, help='Sets size of phoneme groups (1 - single, 2 - pairs, 3 - triplets, 4...). Default: 1')
     parser.add_argument('--file', dest='file', default='file.txt', help='Sets file to read from initial text. Default: file.txt')
     parser.add_argument('--report', dest='report', default='true', help='If report should be generated. Default: true')
+    parser.add_argument('--workers', type=int, dest='workers', default=1, help='Sets number of processes to score chunks. Default: 1')
+    parser.add_argument('--selection', dest='selection', default='exhaustive', help='Sets how chunks are picked (exhaustive or lazy). Default: exhaustive')
+    parser.add_argument('--refresh', type=int, dest='refresh', default=None, help='Sets number of chunks rescored at once by lazy selection. Default: 16')
+    parser.add_argument('--full-refresh', type=int, dest='full_refresh', default=None, help='Sets number of picks between rescoring of all candidates by lazy selection, 0 - only at the first pick. Default: 0')
+    parser.add_argument('--time-budget', type=float, dest='time_budget', default=None, help='Sets seconds synthesis can run before the best result so far is returned. Default: no limit')
+    parser.add_argument('--max-iterations', type=int, dest='max_iterations', default=None, help='Sets iterations synthesis can run before the best result so far is returned. Default: no limit')
+    parser.add_argument('--checkpoint', dest='checkpoint', default=None, help='Sets file to save synthesis progress to. Default: no checkpoints')
+    parser.add_argument('--checkpoint-interval', type=float, dest='checkpoint_interval', default=None, help='Sets min seconds between checkpoints. Default: 60')
+    parser.add_argument('--resume', dest='resume', action='store_true', help='Continues synthesis from --checkpoint file if it exists. Text and synthesis arguments are taken from checkpoint')
+    parser.add_argument('--metrics', dest='metrics', default=None, help='Sets JSON file to save phase timers and counters to. Default: metrics are disabled')
+    parser.add_argument('--trace', dest='trace', default=None, help='Sets JSON lines file to write per-iteration trace to. Default: no trace')
+    parser.add_argument('--cache', dest='cache', default=None, help='Sets directory of cached results. Same text and arguments get cached result without synthesis. Default: no cache')
+    parser.add_argument('--cache-size', type=int, dest='cache_size', default=256, help='Sets max megabytes of cached results, least recently used are removed. Default: 256')
+    parser.add_argument('--parser', dest='parser', default='espeak', help='Sets how new words are transcribed (espeak or http). Default: espeak')
 
     args = parser.parse_args()
     mode = WORD if args.mode == 'word' else SENTENCE
-    compare = TextSynthesis.PVALUE if args.compare == 'pvalue' else TextSynthesis.STATISTIC
+    compare = PVALUE if args.compare == 'pvalue' else STATISTIC
+    phoneme_parser = get_phoneme_parser(args.parser)
 
-    file = open(args.file, "r")
+    if args.metrics or args.trace:
+        metrics.enable(args.trace)
 
-    text = file.read()
-    text_synth = TextSynthesis(text=text, mode=mode, p_value_level=args.pvalue, distribution_criteria=compare, synthesis_mode=args.method)
+    options = dict(workers=args.workers, selection=args.selection, lazy_refresh=args.refresh, lazy_full_refresh=args.full_refresh, time_budget=args.time_budget, max_iterations=args.max_iterations, checkpoint_file=args.checkpoint, checkpoint_interval=args.checkpoint_interval)
 
-    text_synth.synthesis()
+    text = TextBlocks(args.file)
+    parameters = dict(mode=mode, p_value_level=args.pvalue, distribution_criteria=compare, synthesis_mode=args.method, phoneme_group_size=args.group)
+    resume = False
+    if args.resume and args.checkpoint:
+        from phoneme_parser import SynthesisCheckpoint
+
+        resume = SynthesisCheckpoint(args.checkpoint).exists()
+    # results that depend on time budget can't be reused
+    cache = ResultCache(args.cache, args.cache_size * 2 ** 20) if args.cache and args.time_budget is None and not resume else None
+    if cache:
+        cache_key = cache.get_key(text, dict(parameters, selection=args.selection, lazy_refresh=args.refresh, lazy_full_refresh=args.full_refresh, max_iterations=args.max_iterations, parser=args.parser))
+        results = cache.get(cache_key)
+    else:
+        results = None
+
+    if results is None:
+        # synthesis loads numpy and scipy, it is imported only when there is no cached result
+        from phoneme_parser import TextSynthesis
+
+        if resume:
+            options.pop('checkpoint_file')
+            text_synth = TextSynthesis.resume(args.checkpoint, **options)
+        else:
+            text_synth = TextSynthesis(text=text, phoneme_parser=phoneme_parser, **dict(parameters, **options))
+
+        text_synth.synthesis()
+        results = text_synth.get_results()
+        if cache:
+            cache.put(cache_key, results)
 
     if args.report not in ['false', 'no', 'skip', 0]:
-        SpreadsheetExport(data=text_synth.get_results()).save()
+        # exporters load xlsxwriter, they are imported only when report is written
+        from export import SpreadsheetExport, ReportWriter
+
+        with ReportWriter() as report_writer:
+            report_writer.save(SpreadsheetExport(data=results))
+
+    if args.metrics:
+        # summary again, with export time
+        with open(args.metrics, "w") as metrics_file:
+            json.dump(metrics.get_summary(), metrics_file, indent=2, sort_keys=True)
+    metrics.disable()
@@ -0,0 +1,107 @@
+import json
+import time
+
+
+class NullTimer:
+    """
+    Timer of disabled metrics, does nothing.
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_TIMER = NullTimer()
+
+
+class Timer:
+    """
+    Adds time spent in with block to metrics timer.
+    """
+    __slots__ = ('timers', 'name', 'start')
+
+    def __init__(self, timers, name):
+        self.timers = timers
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        timer = self.timers.get(self.name)
+        if timer is None:
+            timer = self.timers[self.name] = [0.0, 0]
+        timer[0] += time.perf_counter() - self.start
+        timer[1] += 1
+        return False
+
+
+class Metrics:
+    """
+    Class that sums time and calls of pipeline phases (transcription, analysis, candidate scoring, KS tests, export...)
+    and counts events. Disabled metrics only check one flag, so they can stay in hot loops.
+    Per-iteration trace is written as JSON lines to trace file, if it is set.
+    Metrics of a process only, KS tests run by worker processes of ParallelChunksScorer are not counted.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.timers = {}
+        self.counters = {}
+        self.trace_file = None
+
+    def enable(self, trace_file_name=None):
+        """
+        :param trace_file_name: string, file to write per-iteration trace to. Default: no trace
+        """
+        self.enabled = True
+        if trace_file_name:
+            self.trace_file = open(trace_file_name, "w")
+
+    def disable(self):
+        self.enabled = False
+        if self.trace_file:
+            self.trace_file.close()
+            self.trace_file = None
+
+    def reset(self):
+        self.timers = {}
+        self.counters = {}
+
+    def timer(self, name):
+        """
+        :param name: string, phase name
+        :return: context manager that adds time of its block to the phase
+        """
+        if not self.enabled:
+            return NULL_TIMER
+        return Timer(self.timers, name)
+
+    def count(self, name, value=1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def trace(self, **values):
+        """
+        Writes one line of trace, e.g. values of one iteration.
+        """
+        if self.trace_file:
+            self.trace_file.write(json.dumps(values) + '\n')
+
+    def get_summary(self):
+        """
+        :return: dict {'timers': {phase: {'seconds': float, 'calls': int}}, 'counters': {name: number}}, or None if
+        metrics are disabled
+        """
+        if not self.enabled:
+            return None
+        return {
+            'timers': {name: {'seconds': seconds, 'calls': calls} for name, (seconds, calls) in self.timers.items()},
+            'counters': dict(self.counters),
+        }
+
+
+metrics = Metrics()
@@ -1,107 +1,291 @@
 import datetime
+import heapq
+from array import array
 import json
+import numpy as np
+import os
 import re
-import requests
-from bs4 import BeautifulSoup
-from scipy import stats
-from subprocess import check_output
+import time
+from concurrent.futures import ProcessPoolExecutor
+from lexicon import SavedPhonemeWords
+from metrics import metrics
+from multiprocessing import shared_memory
+from scipy import sparse
+from text_blocks import TextBlocks, iter_split_blocks, normalize_text
+from transcription import EspeakPhonemeParser
 
 
-def remove_dots(text):
-    return text.replace('.', ' ').strip()
-
+PHONEME_GROUPS = ('single', 'pairs', 'triplets')
 
-def remove_empty_values(words):
-    return list(filter(lambda a: a != '', words))
 
-
-def get_normalized_word(word):
+def get_phoneme_group_name(group_index):
     """
-    Gets word and removes all non letter symbols from it
-    :param word: string
-    :return: string, containing only letters
+    Returns name of phoneme group - 'single', 'pairs', 'triplets', then '4-grams', '5-grams'...
+    :param group_index: int, group size - 1
+    :return: string
     """
-    return re.sub('[^a-zA-Z]', '', word)
+    if group_index < len(PHONEME_GROUPS):
+        return PHONEME_GROUPS[group_index]
+    return '{}-grams'.format(group_index + 1)
+
+
+def remove_dots(text):
+    return text.replace('.', ' ').strip()
 
 
-class HttpPhonemeParser:
+class TokenStream:
     """
-    Class that gets transcription for given text from http.
+    Normalized text as a read-only stream of token ids, made in one pass over text blocks. Every distinct space
+    separated token gets an id and is normalized once to the id of its word, 0 for tokens without letters. A sentence
+    ends after every token that ends with a dot, like parts of text.split('.'), as normalized text has a space after
+    every dot. Analysis and synthesis read words and chunks from the stream, so text is scanned once. Memory is 4
+    bytes per token plus distinct tokens and words. Without keep_order only the count of every distinct token and the
+    number of sentences are kept, so memory is bounded by the vocabulary, but chunks can't be read.
     """
-    AVAILABLE_LANGUAGES = ('english', 'danish', 'german')
-    DEFAULT_LANGUAGE = 'english'
-    ALPHABET = 'IPA'
-    URL2 = 'http://upodn.com/phon.php'
-    USER_AGENT = 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/57.0.2987.133 Safari/537.36'
+    SENTENCE_END = '.'
 
-    def __init__(self, language=None):
-        self.language = language if language in self.AVAILABLE_LANGUAGES else self.DEFAULT_LANGUAGE
+    def __init__(self, tokens, words, token_words, token_counts, sentences_number, token_ids=None,
+                 sentence_ends=None):
+        """
+        :param tokens: tuple of distinct tokens by id
+        :param words: tuple of normalized words by id, words[0] is ''
+        :param token_words: numpy array, word id of every distinct token
+        :param token_counts: numpy array, count of every distinct token in text
+        :param sentences_number: int, number of parts of text.split('.')
+        :param token_ids: numpy array, token id of every token of text, None if order of tokens is not kept
+        :param sentence_ends: numpy array, index of the token after the end of every sentence but the last one, None
+        if order of tokens is not kept
+        """
+        self.tokens = tokens
+        self.words = words
+        self.token_words = token_words
+        self.token_counts = token_counts
+        self.sentences_number = sentences_number
+        self.token_ids = token_ids
+        self.sentence_ends = sentence_ends
+        for values in (self.token_words, self.token_counts, self.token_ids, self.sentence_ends):
+            if values is not None:
+                values.flags.writeable = False
 
-    def text_to_phoneme(self, text):
+    @classmethod
+    def from_blocks(cls, blocks, keep_order=True):
         """
-        Gets text and returns it's transcription. Only first 500 words will get translations.
-        :param text: string
-        :return: string, transcription
+        :param blocks: iterable of normalized text blocks
+        :param keep_order: bool, if token ids should be kept in text order, which chunks of synthesis are read from
+        :return: TokenStream
         """
-        html_doc = self._get_html(text)
-        soup = BeautifulSoup(html_doc, 'html.parser')
-        return soup.find_all('td')[1].find('font').text.strip()
+        words = {'': 0}
+        tokens = {}
+        token_words = []
+        token_counts = array('q')
+        token_ids = array('i')
+        sentence_ends = array('q')
+        sentences_number = 1
+        for token in iter_split_blocks(blocks, ' '):
+            token_id = tokens.get(token)
+            if token_id is None:
+                token_id = tokens[token] = len(token_words)
+                token_words.append(words.setdefault(get_normalized_word(token), len(words)))
+                token_counts.append(0)
+            if keep_order:
+                token_ids.append(token_id)
+            else:
+                token_counts[token_id] += 1
+            if token.endswith(cls.SENTENCE_END):
+                sentences_number += 1
+                if keep_order:
+                    sentence_ends.append(len(token_ids))
+        if not keep_order:
+            return cls(
+                tuple(tokens), tuple(words), np.array(token_words, dtype=np.int32),
+                np.frombuffer(token_counts, dtype=np.int64).copy(), sentences_number
+            )
+        # there is always at least one token, the text after the last space
+        token_ids = np.frombuffer(token_ids, dtype=np.intc).astype(np.int32)
+        return cls(
+            tuple(tokens), tuple(words), np.array(token_words, dtype=np.int32),
+            np.bincount(token_ids, minlength=len(tokens)).astype(np.int64), sentences_number, token_ids,
+            np.array(sentence_ends, dtype=np.int64)
+        )
+
+    def __len__(self):
+        return int(self.token_counts.sum())
+
+    def get_words_count(self):
+        """
+        :return: dict {word: count} of not empty words, in order of first appearance
+        """
+        counts = np.bincount(self.token_words, weights=self.token_counts, minlength=len(self.words)).astype(np.int64)
+        return {word: count for word, count in zip(self.words[1:], counts[1:].tolist()) if count}
+
+    def iter_chunks(self, by_sentence):
+        """
+        :param by_sentence: bool, True for sentences, False for words
+        :return: generator of tuples (chunk text, tuple of not empty word ids of chunk), in text order. Word chunk
+        is the normalized word, sentence chunk is the part of text.split('.')
+        """
+        if self.token_ids is None:
+            raise ValueError('chunks are read from TokenStream that keeps order of tokens')
+        token_words = self.token_words.tolist()
+        if not by_sentence:
+            for token_id in self.token_ids.tolist():
+                word_id = token_words[token_id]
+                yield self.words[word_id], ((word_id,) if word_id else ())
+            return
+        sentences = np.split(self.token_ids, self.sentence_ends)
+        for index, sentence in enumerate(sentences):
+            sentence = sentence.tolist()
+            text = ' '.join([self.tokens[token_id] for token_id in sentence])
+            if index < len(sentences) - 1:
+                text = text[:-1]
+            if index and sentence:
+                # the space after the dot of previous sentence, text that ends with a dot ends with empty sentence
+                text = ' ' + text
+            yield text, tuple(token_words[token_id] for token_id in sentence if token_words[token_id])
+
+
+def get_counts_values(counts, key_groups, keys_number):
+    """
+    Calculates how much percentage does each phoneme take in counts vector.
+    :param counts: numpy array, counts vector or 2-D array with one counts vector per row
+    :param key_groups: numpy array, column of group total for each phoneme column
+    :param keys_number: int, number of phoneme columns
+    :return: numpy array of percentages
+    """
+    totals = counts[..., key_groups]
+    return np.divide(counts[..., :keys_number], totals, out=np.zeros(totals.shape), where=totals > 0)
+
+
+def remove_empty_values(words):
+    return list(filter(lambda a: a != '', words))
 
-    def _get_html(self, text):
-        request = {'intext': text, 'ipa': 0}
-        headers = {'User-Agent': self.USER_AGENT}
-        s = requests.Session()
-        res = s.post(self.URL2, request, headers=headers)
-        return res.text
 
+NOT_LETTERS = re.compile('[^a-zA-Z]')
 
-class EspeakPhonemeParser:
+
+def get_normalized_word(word):
     """
-    Class that gets transcription for given text using espeak subprocess.
+    Gets word and removes all non letter symbols from it
+    :param word: string
+    :return: string, containing only letters
     """
-    def text_to_phoneme(self, text):
-        return check_output(["espeak", "-q", "--ipa", '-v', 'en-us', text]).strip().decode('utf-8')
+    return NOT_LETTERS.sub('', word)
 
 
-class SavedPhonemeWords:
+class SavedWordNgrams:
     """
-    Class that saves/gets words and theirs phonemes to/from file.
+    Class that saves/gets phoneme groups counts of words to/from the sqlite file of SavedPhonemeWords, so words are
+    not parsed again by next runs. Every phoneme group gets a persistent id in ngrams table, counts of a word are kept
+    as two int32 blobs (ids and counts) and loaded with np.frombuffer, without parsing strings.
+    Saved counts are used only if they were parsed from the same transcription by the same Word.PARSE_VERSION.
     """
-    FILE_NAME = "saved_phonemes.json"
+    BATCH_SIZE = 500
+    DTYPE = np.dtype('<i4')
 
     @classmethod
-    def get(cls):
+    def connect(cls):
+        connection = SavedPhonemeWords.connect()
+        with connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS ngrams ('
+                'id INTEGER PRIMARY KEY, group_index INTEGER NOT NULL, ngram TEXT NOT NULL, UNIQUE (group_index, ngram))'
+            )
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS word_ngrams ('
+                'word TEXT NOT NULL, group_size INTEGER NOT NULL, transcription TEXT NOT NULL, version INTEGER NOT NULL, '
+                'ids BLOB NOT NULL, counts BLOB NOT NULL, PRIMARY KEY (word, group_size))'
+            )
+        return connection
+
+    @classmethod
+    def get(cls, transcriptions, group_size):
         """
-        opens file and gets from it words and their phonemes
-        :return: dict {'word': 'phoneme'} or an empty dict
+        Gets saved phoneme groups counts of words.
+        :param transcriptions: dict {'word': 'phoneme'}
+        :param group_size: int, max size of phoneme groups
+        :return: tuple (dict {'word': (ids, counts)} of words with valid saved counts, where ids are persistent
+        numpy arrays, dict {id: (group_index, ngram)} of every id of these words)
         """
+        words = list(transcriptions)
+        saved = {}
+        ngrams = {}
+        connection = cls.connect()
         try:
-            words_file = open(cls.FILE_NAME, "r")
-            read = words_file.read()
-            saved_phoneme_words = json.loads(read)
-            words_file.close()
-        except:
-            saved_phoneme_words = dict()
-        return saved_phoneme_words
+            for i in range(0, len(words), cls.BATCH_SIZE):
+                batch = words[i:i + cls.BATCH_SIZE]
+                rows = connection.execute(
+                    'SELECT word, transcription, version, ids, counts FROM word_ngrams '
+                    'WHERE group_size = ? AND word IN ({})'.format(', '.join('?' * len(batch))), [group_size] + batch
+                )
+                for word, transcription, version, ids, counts in rows:
+                    if transcription == transcriptions[word] and version == Word.PARSE_VERSION:
+                        saved[word] = (np.frombuffer(ids, dtype=cls.DTYPE), np.frombuffer(counts, dtype=cls.DTYPE))
+
+            ids = np.unique(np.concatenate([ids for ids, counts in saved.values()] or [np.zeros(0, dtype=cls.DTYPE)]))
+            ids = ids.tolist()
+            for i in range(0, len(ids), cls.BATCH_SIZE):
+                batch = ids[i:i + cls.BATCH_SIZE]
+                rows = connection.execute(
+                    'SELECT id, group_index, ngram FROM ngrams WHERE id IN ({})'.format(', '.join('?' * len(batch))),
+                    batch
+                )
+                for ngram_id, group_index, ngram in rows:
+                    ngrams[ngram_id] = (group_index, ngram)
+        finally:
+            connection.close()
+        return saved, ngrams
 
     @classmethod
-    def update(cls, saved_phoneme_words):
+    def update(cls, words, transcriptions, vocabulary, group_size):
         """
-        opens file and saves dict
-        :param saved_phoneme_words: dict to be saved
+        Saves phoneme groups counts of parsed words.
+        :param words: list of Word
+        :param transcriptions: dict {'word': 'phoneme'}, transcriptions words were parsed from
+        :param vocabulary: PhonemeVocabulary of words ids
+        :param group_size: int, max size of phoneme groups words were parsed with
         """
-        file = open(cls.FILE_NAME, "w")
-        file.write(json.dumps(saved_phoneme_words))
-        file.close()
+        if not words:
+            return
+        vocabulary_ids = np.unique(np.concatenate([word.phoneme_ids for word in words])).tolist()
+        keys = [(vocabulary.groups[i], vocabulary.phonemes[i]) for i in vocabulary_ids]
+        persistent_ids = np.full(len(vocabulary), -1, dtype=np.int64)
+        connection = cls.connect()
+        try:
+            with connection:
+                connection.executemany('INSERT OR IGNORE INTO ngrams (group_index, ngram) VALUES (?, ?)', keys)
+                for vocabulary_id, key in zip(vocabulary_ids, keys):
+                    persistent_ids[vocabulary_id] = connection.execute(
+                        'SELECT id FROM ngrams WHERE group_index = ? AND ngram = ?', key
+                    ).fetchone()[0]
+                connection.executemany(
+                    'INSERT OR REPLACE INTO word_ngrams (word, group_size, transcription, version, ids, counts) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (
+                        (
+                            word.text, group_size, transcriptions[word.text], Word.PARSE_VERSION,
+                            persistent_ids[word.phoneme_ids].astype(cls.DTYPE).tobytes(),
+                            word.phoneme_counts.astype(cls.DTYPE).tobytes()
+                        )
+                        for word in words
+                    )
+                )
+        finally:
+            connection.close()
 
 
 class UniquePhonemeWords:
     """
     Class that gets unique words and their phonemes from text.
     """
-    def __init__(self, text):
+    def __init__(self, text, phoneme_parser=None, words=None):
+        """
+        :param text: string
+        :param phoneme_parser: parser to get phonemes of words that are not saved. Default: EspeakPhonemeParser
+        :param words: list of normalized words, used instead of words of text if given
+        """
         self.text = text
-        self.words = [get_normalized_word(word) for word in text.split(' ') if word]
+        self.words = words if words is not None else [get_normalized_word(word) for word in text.split(' ') if word]
+        self.phoneme_parser = phoneme_parser or EspeakPhonemeParser()
 
     def get(self):
         """
@@ -109,87 +293,166 @@ class UniquePhonemeWords:
         number of requests.
         :return:
         """
-        saved_phoneme_words = SavedPhonemeWords.get()
+        unique_words = list(dict.fromkeys(self.words))
+        saved_phoneme_words = SavedPhonemeWords.get(unique_words)
+        saved_phoneme_words.setdefault('', '')
+        new_words = [word for word in unique_words if word not in saved_phoneme_words]
+
+        metrics.count('saved_words', len(unique_words) - len(new_words))
+        metrics.count('transcribed_words', len(new_words))
+
+        new_phoneme_words = dict()
+        with metrics.timer('transcription'):
+            try:
+                for word, phoneme in self.phoneme_parser.words_to_phonemes(new_words):
+                    saved_phoneme_words[word] = phoneme
+                    new_phoneme_words[word] = phoneme
+                    if len(new_phoneme_words) >= SavedPhonemeWords.BATCH_SIZE:
+                        SavedPhonemeWords.update(new_phoneme_words)
+                        new_phoneme_words = dict()
+            finally:
+                SavedPhonemeWords.update(new_phoneme_words)
+
         current_text_phoneme_words = dict()
-        for word in self.words:
-            if word in current_text_phoneme_words.keys():
-                continue
-            if word not in saved_phoneme_words.keys():
-                try:
-                    phoneme = EspeakPhonemeParser().text_to_phoneme(word)
-                except Exception:
-                    SavedPhonemeWords.update(saved_phoneme_words)
-                    raise
-                saved_phoneme_words[word] = phoneme
-                print('Getting phoneme for ' + word + ' - ' + phoneme)
+        for word in unique_words:
             current_text_phoneme_words[word] = saved_phoneme_words[word]
-
-        SavedPhonemeWords.update(saved_phoneme_words)
         return current_text_phoneme_words
 
 
-class TextAnalyzer:
+class PhonemeVocabulary:
     """
-    Class to analyze text
+    Class that gives integer ids to phonemes, phoneme pairs, triplets and bigger groups, so they are counted in arrays.
+    Id is given to phoneme of a group, the same string in different groups gets different ids.
     """
-    def __init__(self, text):
-        self.text = text
-        self.words_info = {}
-        self.phonemes_count = {
-            'single': {},
-            'pairs': {},
-            'triplets': {}
-        }
-        self.single_phonemes_count = 0
-        self.pair_phonemes_count = 0
-        self.triplet_phonemes_count = 0
+    def __init__(self):
+        self.ids = {}
+        self.phonemes = []
+        self.groups = []
 
-        self.unique_phoneme_words = UniquePhonemeWords(self.text).get()
-        print('unique phonemes found')
+    def __len__(self):
+        return len(self.phonemes)
 
-        self._analyze_words()
-        self._analyze_phonemes()
+    def get_id(self, group_index, phoneme):
+        """
+        Returns id of phoneme, new id is given to phoneme that is not known yet.
+        :param group_index: int, group size - 1
+        :param phoneme: string, phoneme (pair, triplet)
+        :return: int
+        """
+        key = (group_index, phoneme)
+        phoneme_id = self.ids.get(key)
+        if phoneme_id is None:
+            phoneme_id = self.ids[key] = len(self.phonemes)
+            self.phonemes.append(phoneme)
+            self.groups.append(group_index)
+        return phoneme_id
+
+    def get_groups(self):
+        """
+        :return: numpy array, group index of every id
+        """
+        return np.array(self.groups, dtype=np.int64)
 
-    def _get_words_list(self):
-        text = [get_normalized_word(word) for word in self.text.split(' ')]
-        return remove_empty_values(text)
+    def decode(self, ids, counts):
+        """
+        Turns arrays of ids and counts back to dict of phonemes counts.
+        :param ids: numpy array of ids
+        :param counts: numpy array of counts
+        :return: dict {'single': {'a': count}, 'pairs': {'ab': count}, 'triplets': {'abc': count}, ...}
+        """
+        phonemes_dict = {get_phoneme_group_name(i): dict() for i in range(max(self.groups, default=-1) + 1)}
+        for phoneme_id, count in zip(ids.tolist(), counts.tolist()):
+            phonemes_dict[get_phoneme_group_name(self.groups[phoneme_id])][self.phonemes[phoneme_id]] = count
+        return phonemes_dict
 
-    def _analyze_words(self):
+
+class TextAnalyzer:
+    """
+    Class to analyze text
+    """
+    CACHE_NGRAMS = True
+
+    def __init__(self, text, phoneme_parser=None, phoneme_group_size=3, keep_order=True):
+        """
+        :param text: string, or iterable of normalized text blocks (TextBlocks) to analyze text without keeping it in
+        memory
+        :param phoneme_parser: parser to get phonemes of words that are not saved
+        :param phoneme_group_size: int, max size of phoneme groups
+        :param keep_order: bool, if TokenStream keeps tokens in text order, which synthesis needs. Analysis without it
+        takes memory bounded by the vocabulary
         """
-        Loops thought all words and saves information to self.words_info.
+        self.text = text if isinstance(text, str) else None
+        self.text_blocks = (text,) if isinstance(text, str) else text
+        self.phoneme_group_size = phoneme_group_size
+        self.keep_order = keep_order
+        self.vocabulary = PhonemeVocabulary()
+        self.words = {}
+        self.tokens = None
+        self.words_count = {}
+        self.tokens_number = 0
+        self.phonemes_count = None
+        self.groups_count = np.zeros(phoneme_group_size, dtype=np.int64)
+
+        with metrics.timer('tokenization'):
+            self._count_words()
+        self.unique_phoneme_words = UniquePhonemeWords(
+            self.text, phoneme_parser, words=list(self.words_count)
+        ).get()
+
+        with metrics.timer('analysis'):
+            self._analyze_words()
+            self._analyze_phonemes()
+
+    def _count_words(self):
         """
-        words = self._get_words_list()
+        Reads text block by block to self.tokens, saves count of each normalized word to self.words_count and number
+        of space separated tokens (len(text.split(' '))) to self.tokens_number.
+        """
+        self.tokens = TokenStream.from_blocks(self.text_blocks, self.keep_order)
+        self.tokens_number = len(self.tokens)
+        self.words_count = self.tokens.get_words_count()
 
-        for current_word in words:
-            if current_word in self.words_info:
-                self.words_info[current_word]['count'] += 1
+    def _analyze_words(self):
+        """
+        Saves Word of each unique word to self.words, in order of first appearance. Phoneme groups counts of words
+        are loaded from SavedWordNgrams if CACHE_NGRAMS is set, only words that are not saved are parsed.
+        """
+        transcriptions = {word: self.unique_phoneme_words[word] for word in self.words_count}
+        saved, ngrams = SavedWordNgrams.get(transcriptions, self.phoneme_group_size) if self.CACHE_NGRAMS else ({}, {})
+        metrics.count('cached_words', len(saved))
+
+        # persistent ids of saved words are mapped to vocabulary ids at once
+        saved_ids = np.unique(np.concatenate(
+            [ids for ids, counts in saved.values()] or [np.zeros(0, dtype=SavedWordNgrams.DTYPE)]
+        ))
+        vocabulary_ids = np.full(saved_ids[-1] + 1 if len(saved_ids) else 0, -1, dtype=np.int32)
+        vocabulary_ids[saved_ids] = [self.vocabulary.get_id(*ngrams[ngram_id]) for ngram_id in saved_ids.tolist()]
+
+        parsed_words = []
+        for current_word, transcription in transcriptions.items():
+            if current_word in saved:
+                ids, counts = saved[current_word]
+                self.words[current_word] = Word.from_counts(current_word, transcription, vocabulary_ids[ids], counts)
             else:
-                transcription = self.unique_phoneme_words[current_word]
-                self.words_info[current_word] = {
-                    'count': 1,
-                    'word': Word(current_word, transcription)
-                }
+                word = Word(current_word, transcription, self.vocabulary, self.phoneme_group_size)
+                self.words[current_word] = word
+                parsed_words.append(word)
+
+        if self.CACHE_NGRAMS:
+            SavedWordNgrams.update(parsed_words, transcriptions, self.vocabulary, self.phoneme_group_size)
 
     def _analyze_phonemes(self):
         """
-        Loops through all phonemes and saves how much of each phonemes, phoneme pairs and phoneme triplets there are
-        and sum of all phonemes in text.
+        Loops through all words and saves how much of each phonemes, phoneme pairs, triplets and bigger groups there
+        are to self.phonemes_count (by id) and sum of phonemes of each group in text to self.groups_count.
         """
-        for word_text, word_info in self.words_info.items():
-            for phoneme, phoneme_count in word_info['word'].phonemes_dict['single'].items():
-                occurrences = phoneme_count * word_info['count']
-                self.single_phonemes_count += occurrences
-                self.phonemes_count['single'][phoneme] = self.phonemes_count['single'].get(phoneme, 0) + occurrences
-
-            for pair, pair_count in word_info['word'].phonemes_dict['pairs'].items():
-                occurrences = pair_count * word_info['count']
-                self.pair_phonemes_count += occurrences
-                self.phonemes_count['pairs'][pair] = self.phonemes_count['pairs'].get(pair, 0) + occurrences
+        self.phonemes_count = np.zeros(len(self.vocabulary), dtype=np.int64)
+        for word_text, word in self.words.items():
+            self.phonemes_count[word.phoneme_ids] += word.phoneme_counts * self.words_count[word_text]
 
-            for triplet, triplet_count in word_info['word'].phonemes_dict['triplets'].items():
-                occurrences = triplet_count * word_info['count']
-                self.triplet_phonemes_count += occurrences
-                self.phonemes_count['triplets'][triplet] = self.phonemes_count['triplets'].get(triplet, 0) + occurrences
+        self.groups_count = np.bincount(
+            self.vocabulary.get_groups(), weights=self.phonemes_count, minlength=self.phoneme_group_size
+        ).astype(np.int64)
 
     def get_initial_percentage(self):
         """
@@ -203,39 +466,37 @@ class TextAnalyzer:
             },
             'triplets': {
                 'abc': percentage
-            }
+            },
+            ...
         }
         """
-        percentage = {
-            'single': {},
-            'pairs': {},
-            'triplets': {}
-        }
-        for phoneme, count in self.phonemes_count['single'].items():
-            percentage['single'][phoneme] = count / self.single_phonemes_count
-
-        for pair, pair_count in self.phonemes_count['pairs'].items():
-            percentage['pairs'][pair] = pair_count / self.pair_phonemes_count
-
-        for triplet, triplet_count in self.phonemes_count['triplets'].items():
-            percentage['triplets'][triplet] = triplet_count / self.triplet_phonemes_count
+        percentage = {get_phoneme_group_name(i): dict() for i in range(self.phoneme_group_size)}
+        for phoneme_id, count in enumerate(self.phonemes_count.tolist()):
+            group_index = self.vocabulary.groups[phoneme_id]
+            percentage[get_phoneme_group_name(group_index)][self.vocabulary.phonemes[phoneme_id]] = (
+                count / self.groups_count[group_index].item()
+            )
         return percentage
 
     def get_percentage(self, chunk, phonemes_num):
         """
         Calculates how much percentage does each phoneme take in given chunk of initial text.
         :param chunk: string, part of initial text
-        :param phonemes_num: string, number of phonemes to get percentage - 'single', 'pairs', 'triplets'
+        :param phonemes_num: string, number of phonemes to get percentage - 'single', 'pairs', 'triplets', '4-grams'...
         :return: dict {phoneme: percentage}
         """
+        group_index = [get_phoneme_group_name(i) for i in range(self.phoneme_group_size)].index(phonemes_num)
         all_phonemes = 0
         phonemes = {}
         for word in chunk.split(' '):
             word = get_normalized_word(word)
             if not word:
                 continue
-            phonemes_count = self.words_info[word]['word'].phonemes_dict[phonemes_num]
-            for phoneme, count in phonemes_count.items():
+            word = self.words[word]
+            for phoneme_id, count in zip(word.phoneme_ids.tolist(), word.phoneme_counts.tolist()):
+                if self.vocabulary.groups[phoneme_id] != group_index:
+                    continue
+                phoneme = self.vocabulary.phonemes[phoneme_id]
                 phonemes[phoneme] = phonemes.get(phoneme, 0) + count
                 all_phonemes += count
 
@@ -245,6 +506,583 @@ class TextAnalyzer:
         return percentage
 
 
+class CorpusStatistics:
+    """
+    Class that keeps word counts and phoneme (pair, triplet...) counts of text, so statistics of text shards analyzed
+    separately can be merged into statistics of whole text. Phonemes are kept as strings, as ids of vocabularies of
+    different shards don't match.
+    Statistics are saved to uncompressed .npz file of plain arrays, so they are loaded without parsing.
+    """
+    def __init__(self, phoneme_group_size, words, words_counts, phonemes, phoneme_groups, phoneme_counts, tokens_number):
+        """
+        :param phoneme_group_size: int, max size of phoneme groups
+        :param words: numpy array of unique words
+        :param words_counts: numpy array, count of each word
+        :param phonemes: numpy array of unique phonemes (pairs, triplets...)
+        :param phoneme_groups: numpy array, group index (group size - 1) of each phoneme
+        :param phoneme_counts: numpy array, count of each phoneme
+        :param tokens_number: int, number of space separated tokens of text
+        """
+        self.phoneme_group_size = phoneme_group_size
+        self.words = words
+        self.words_counts = words_counts
+        self.phonemes = phonemes
+        self.phoneme_groups = phoneme_groups
+        self.phoneme_counts = phoneme_counts
+        self.tokens_number = tokens_number
+
+    @classmethod
+    def from_analyzer(cls, text_analyzer):
+        """
+        :param text_analyzer: TextAnalyzer
+        :return: CorpusStatistics
+        """
+        words = list(text_analyzer.words_count)
+        return cls(
+            text_analyzer.phoneme_group_size,
+            np.array(words, dtype=str),
+            np.array([text_analyzer.words_count[word] for word in words], dtype=np.int64),
+            np.array(text_analyzer.vocabulary.phonemes, dtype=str),
+            text_analyzer.vocabulary.get_groups(),
+            text_analyzer.phonemes_count.copy(),
+            text_analyzer.tokens_number
+        )
+
+    @classmethod
+    def merge(cls, statistics_list):
+        """
+        Sums statistics of shards.
+        :param statistics_list: list of CorpusStatistics with the same phoneme_group_size
+        :return: CorpusStatistics
+        """
+        group_sizes = {statistics.phoneme_group_size for statistics in statistics_list}
+        if len(group_sizes) != 1:
+            raise ValueError('Can not merge statistics of different phoneme group sizes: {}'.format(group_sizes))
+
+        words, words_inverse = np.unique(
+            np.concatenate([statistics.words for statistics in statistics_list]), return_inverse=True
+        )
+        words_counts = np.bincount(
+            words_inverse, weights=np.concatenate([statistics.words_counts for statistics in statistics_list]),
+            minlength=len(words)
+        ).astype(np.int64)
+
+        # the same phoneme string in different groups is a different key, so group index is added to the key
+        phoneme_keys = np.concatenate([
+            np.char.add(statistics.phoneme_groups.astype(str), np.char.add(' ', statistics.phonemes))
+            for statistics in statistics_list
+        ])
+        keys, first, phonemes_inverse = np.unique(phoneme_keys, return_index=True, return_inverse=True)
+        phoneme_counts = np.bincount(
+            phonemes_inverse, weights=np.concatenate([statistics.phoneme_counts for statistics in statistics_list]),
+            minlength=len(keys)
+        ).astype(np.int64)
+
+        return cls(
+            group_sizes.pop(), words, words_counts,
+            np.concatenate([statistics.phonemes for statistics in statistics_list])[first],
+            np.concatenate([statistics.phoneme_groups for statistics in statistics_list])[first],
+            phoneme_counts, sum(statistics.tokens_number for statistics in statistics_list)
+        )
+
+    def get_groups_count(self):
+        """
+        :return: numpy array, sum of phonemes of each group
+        """
+        return np.bincount(
+            self.phoneme_groups, weights=self.phoneme_counts, minlength=self.phoneme_group_size
+        ).astype(np.int64)
+
+    def get_initial_percentage(self):
+        """
+        Calculates how much percentage does each phoneme take in text, like TextAnalyzer.get_initial_percentage.
+        :return: dict {'single': {'a': percentage}, 'pairs': {'ab': percentage}, 'triplets': {'abc': percentage}, ...}
+        """
+        groups_count = self.get_groups_count().tolist()
+        percentage = {get_phoneme_group_name(i): dict() for i in range(self.phoneme_group_size)}
+        for phoneme, group_index, count in zip(
+                self.phonemes.tolist(), self.phoneme_groups.tolist(), self.phoneme_counts.tolist()
+        ):
+            percentage[get_phoneme_group_name(group_index)][phoneme] = count / groups_count[group_index]
+        return percentage
+
+    def save(self, file_name):
+        with open(file_name, 'wb') as file:
+            np.savez(
+                file, phoneme_group_size=self.phoneme_group_size, words=self.words, words_counts=self.words_counts,
+                phonemes=self.phonemes, phoneme_groups=self.phoneme_groups, phoneme_counts=self.phoneme_counts,
+                tokens_number=self.tokens_number
+            )
+
+    @classmethod
+    def load(cls, file_name):
+        with np.load(file_name) as arrays:
+            return cls(
+                arrays['phoneme_group_size'].item(), arrays['words'], arrays['words_counts'], arrays['phonemes'],
+                arrays['phoneme_groups'], arrays['phoneme_counts'], arrays['tokens_number'].item()
+            )
+
+
+class PhonemeCountVectors:
+    """
+    Class that keeps phoneme counts of text chunks as vectors, so counts of joined chunks are got by adding vectors.
+    Vector has count of every phoneme (pair, triplet) of initial text followed by number of all phonemes of each group.
+    """
+    def __init__(self, text_analyzer, phoneme_group_size):
+        """
+        :param text_analyzer: TextAnalyzer of initial text
+        :param phoneme_group_size: int, number of groups to count - 'single', 'pairs', 'triplets', '4-grams'...
+        """
+        self.text_analyzer = text_analyzer
+        self.phoneme_group_size = phoneme_group_size
+        self.words_counts = {}
+
+        groups = text_analyzer.vocabulary.get_groups()
+        ids = np.flatnonzero((groups < phoneme_group_size) & (text_analyzer.phonemes_count > 0))
+        self.ids = ids[np.argsort(groups[ids], kind='stable')]
+        self.keys_number = len(self.ids)
+        self.size = self.keys_number + phoneme_group_size
+        self.key_groups = groups[self.ids] + self.keys_number
+        self.id_columns = np.full(len(groups), -1, dtype=np.int64)
+        self.id_columns[self.ids] = np.arange(self.keys_number)
+        self.id_groups = groups
+        self.column_phonemes = [text_analyzer.vocabulary.phonemes[i] for i in self.ids.tolist()]
+
+    @classmethod
+    def from_columns(cls, column_phonemes, column_groups, phoneme_group_size):
+        """
+        Restores count vectors of saved columns, without text analyzer. Chunks counts can't be got from it, only
+        values and distributions of counts vectors.
+        :param column_phonemes: list of phoneme (pair, triplet) of each column
+        :param column_groups: numpy array, group index of each column
+        :param phoneme_group_size: int
+        :return: PhonemeCountVectors
+        """
+        count_vectors = cls.__new__(cls)
+        count_vectors.text_analyzer = None
+        count_vectors.phoneme_group_size = phoneme_group_size
+        count_vectors.words_counts = {}
+        count_vectors.keys_number = len(column_phonemes)
+        count_vectors.size = count_vectors.keys_number + phoneme_group_size
+        count_vectors.key_groups = column_groups + count_vectors.keys_number
+        count_vectors.column_phonemes = column_phonemes
+        return count_vectors
+
+    def empty(self):
+        return np.zeros(self.size, dtype=np.int64)
+
+    def get_word_counts(self, word):
+        """
+        Returns counts vector of normalized word. Vectors are cached, as words are repeated a lot.
+        :param word: string, normalized word
+        :return: numpy array
+        """
+        counts = self.words_counts.get(word)
+        if counts is not None:
+            return counts
+
+        counts = self.empty()
+        word = self.text_analyzer.words[word]
+        columns = self.id_columns[word.phoneme_ids]
+        selected = columns >= 0
+        counts[columns[selected]] = word.phoneme_counts[selected]
+        np.add.at(counts, self.keys_number + self.id_groups[word.phoneme_ids[selected]], word.phoneme_counts[selected])
+        self.words_counts[word.text] = counts
+        return counts
+
+    def get_chunks_matrix(self, tokens, by_sentence, keep_rows=True):
+        """
+        Builds sparse matrix of counts vectors of unique chunks in one pass over chunks of token stream.
+        :param tokens: TokenStream of initial text
+        :param by_sentence: bool, True if chunks are sentences, False if words
+        :param keep_rows: bool, if row of every chunk should be kept in text order
+        :return: tuple (unique chunks list, scipy.sparse.csr_matrix with one counts vector per row,
+        numpy array with how many times each unique chunk is in text, numpy array with row of every chunk in text
+        order or None without keep_rows)
+        """
+        chunks_rows = {}
+        rows = array('i')
+        multiplicity = array('q')
+        indptr = [0]
+        indices = []
+        data = []
+        for chunk, word_ids in tokens.iter_chunks(by_sentence):
+            row = chunks_rows.get(chunk)
+            if row is None:
+                row = chunks_rows[chunk] = len(chunks_rows)
+                counts = self.empty()
+                for word_id in word_ids:
+                    counts += self.get_word_counts(tokens.words[word_id])
+                columns = np.flatnonzero(counts)
+                indices.extend(columns.tolist())
+                data.extend(counts[columns].tolist())
+                indptr.append(len(indices))
+                multiplicity.append(0)
+            if keep_rows:
+                rows.append(row)
+            else:
+                multiplicity[row] += 1
+
+        matrix = sparse.csr_matrix(
+            (np.array(data, dtype=np.int64), np.array(indices, dtype=np.int64), np.array(indptr, dtype=np.int64)),
+            shape=(len(chunks_rows), self.size)
+        )
+        if not keep_rows:
+            return list(chunks_rows), matrix, np.frombuffer(multiplicity, dtype=np.int64).copy(), None
+        rows = np.frombuffer(rows, dtype=np.intc).astype(np.int32)
+        multiplicity = np.bincount(rows, minlength=len(chunks_rows)).astype(np.int64)
+        return list(chunks_rows), matrix, multiplicity, rows
+
+    def get_values(self, counts):
+        """
+        Calculates how much percentage does each phoneme take in counts vector. Gives the same values as
+        TextAnalyzer.get_percentage for the same chunk.
+        :param counts: numpy array, counts vector or 2-D array with one counts vector per row
+        :return: numpy array of percentages in columns order
+        """
+        return get_counts_values(counts, self.key_groups, self.keys_number)
+
+    def get_distribution(self, counts):
+        """
+        Returns percentage of each phoneme (pair, triplet) that is in counts vector.
+        :param counts: numpy array
+        :return: dict {phoneme: percentage}
+        """
+        values = self.get_values(counts)
+        distribution = {}
+        for column in np.flatnonzero(counts[:self.keys_number]).tolist():
+            distribution[self.column_phonemes[column]] = values[column].item()
+        return distribution
+
+
+class ChunksScorer:
+    """
+    Class that scores candidate chunks by KS test of text with each chunk added or removed against initial
+    distribution.
+    """
+    def __init__(self, chunks_counts, initial_values, key_groups, keys_number):
+        """
+        :param chunks_counts: scipy.sparse.csr_matrix, counts vector of each chunk
+        :param initial_values: numpy array, initial distribution values
+        :param key_groups: numpy array, column of group total for each phoneme column
+        :param keys_number: int, number of phoneme columns
+        """
+        self.chunks_counts = chunks_counts
+        self.initial_values = initial_values
+        self.key_groups = key_groups
+        self.keys_number = keys_number
+
+    def ks_test(self, text_counts, indexes, sign):
+        """
+        KS tests initial distribution against text with each of the chunks added (sign 1) or removed (sign -1).
+        Chunks are taken from chunks_counts in blocks, so only a block of rows is dense at once.
+        :param text_counts: counts vector of text
+        :param indexes: numpy array, indexes of chunks
+        :param sign: 1 or -1
+        :return: tuple (statistics, pvalues) of 1-D arrays
+        """
+        statistics = np.zeros(len(indexes))
+        pvalues = np.zeros(len(indexes))
+        block_size = max(1, KS_BATCH_SIZE // (2 * self.chunks_counts.shape[1]))
+        for start in range(0, len(indexes), block_size):
+            block = indexes[start:start + block_size]
+            counts = text_counts + sign * self.chunks_counts[block].toarray()
+            statistics[start:start + block_size], pvalues[start:start + block_size] = ks_2samp_batch(
+                self.initial_values, get_counts_values(counts, self.key_groups, self.keys_number)
+            )
+        return statistics, pvalues
+
+    def pick(self, text_counts, indexes, sign, by_pvalue, highest):
+        """
+        Picks chunk with highest (or lowest) p-value (or statistic). The first one is picked of equal chunks.
+        :param text_counts: counts vector of text
+        :param indexes: numpy array, indexes of candidate chunks, not empty
+        :param sign: 1 to score adding chunk to text, -1 to score removing it
+        :param by_pvalue: bool, compare p-values if True, statistics otherwise
+        :param highest: bool, pick highest value if True, lowest otherwise
+        :return: tuple (score, index), score is the value (negated for lowest) to compare picks of several scorers
+        """
+        scores = self.score(text_counts, indexes, sign, by_pvalue, highest)
+        position = np.argmax(scores)
+        return scores[position].item(), int(indexes[position])
+
+    def score(self, text_counts, indexes, sign, by_pvalue, highest):
+        """
+        Scores chunks, the better chunk the higher score. Arguments are the same as of pick.
+        :return: numpy array, p-value (or statistic) of each chunk, negated if lowest is better
+        """
+        statistics, pvalues = self.ks_test(text_counts, indexes, sign)
+        scores = pvalues if by_pvalue else statistics
+        return scores if highest else -scores
+
+    def close(self):
+        pass
+
+
+chunks_scorer = None
+
+
+def init_chunks_scorer_worker(shared_names, shapes, dtypes, matrix_shape, initial_values, key_groups, keys_number):
+    """
+    Initializes ChunksScorer of worker process over chunks counts matrix arrays in shared memory.
+    """
+    global chunks_scorer
+    arrays = []
+    for name, shape, dtype in zip(shared_names, shapes, dtypes):
+        shared = shared_memory.SharedMemory(name=name)
+        arrays.append((shared, np.ndarray(shape, dtype=dtype, buffer=shared.buf)))
+    data, indices, indptr = [values for shared, values in arrays]
+    chunks_counts = sparse.csr_matrix((data, indices, indptr), shape=matrix_shape, copy=False)
+    chunks_scorer = ChunksScorer(chunks_counts, initial_values, key_groups, keys_number)
+    # keep shared memory open while the worker is alive
+    chunks_scorer.shared = [shared for shared, values in arrays]
+
+
+def pick_chunk_in_worker(*args):
+    return chunks_scorer.pick(*args)
+
+
+class ParallelChunksScorer:
+    """
+    Class that scores candidate chunks in a pool of processes. Chunks counts matrix is put to shared memory once,
+    candidates are split to one shard per worker, each worker sends back only its best chunk.
+    Picks the same chunk as ChunksScorer.
+    """
+    def __init__(self, scorer, workers):
+        """
+        :param scorer: ChunksScorer to share with workers
+        :param workers: int, number of processes
+        """
+        self.workers = workers
+        self.scorer = scorer
+        self.shared = []
+        matrix = scorer.chunks_counts
+        arrays = [matrix.data, matrix.indices, matrix.indptr]
+        for values in arrays:
+            shared = shared_memory.SharedMemory(create=True, size=max(1, values.nbytes))
+            np.ndarray(values.shape, dtype=values.dtype, buffer=shared.buf)[:] = values
+            self.shared.append(shared)
+
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=init_chunks_scorer_worker,
+            initargs=(
+                [shared.name for shared in self.shared], [values.shape for values in arrays],
+                [values.dtype for values in arrays], matrix.shape, scorer.initial_values, scorer.key_groups,
+                scorer.keys_number
+            )
+        )
+
+    def pick(self, text_counts, indexes, sign, by_pvalue, highest):
+        """
+        Same as ChunksScorer.pick, shards are scored by workers.
+        """
+        shards = [shard for shard in np.array_split(indexes, self.workers) if len(shard)]
+        futures = [
+            self.executor.submit(pick_chunk_in_worker, text_counts, shard, sign, by_pvalue, highest) for shard in shards
+        ]
+        best_score, best_index = None, None
+        for future in futures:
+            score, index = future.result()
+            if best_score is None or score > best_score:
+                best_score, best_index = score, index
+        return best_score, best_index
+
+    def score(self, *args):
+        """
+        Same as ChunksScorer.score, scored in this process, as it is used for few chunks.
+        """
+        return self.scorer.score(*args)
+
+    def close(self):
+        self.executor.shutdown()
+        for shared in self.shared:
+            shared.close()
+            shared.unlink()
+
+
+class LazyChunksSelector:
+    """
+    Class that picks chunks by lazy greedy search. Candidates are kept in a heap by their last score, and at every
+    pick only chunks at the top of the heap are rescored, refresh chunks at once, until the top chunk has a score of
+    the current text. Scores change little after one chunk is added or removed, so the pick is usually the same as of
+    scoring every candidate, for a small part of the work.
+    """
+    REFRESH = 16
+    FULL_REFRESH = 0
+
+    def __init__(self, scorer, get_candidates, sign, by_pvalue, highest, refresh=None, full_refresh=None):
+        """
+        :param scorer: ChunksScorer or ParallelChunksScorer
+        :param get_candidates: function that gets remaining counts of chunks and returns indexes of candidates
+        :param sign: 1 to score adding chunk to text, -1 to score removing it
+        :param by_pvalue: bool, compare p-values if True, statistics otherwise
+        :param highest: bool, pick highest value if True, lowest otherwise
+        :param refresh: int, number of chunks rescored at once. Default: REFRESH
+        :param full_refresh: int, every candidate is rescored every full_refresh picks, 0 - only at the first pick.
+        Default: FULL_REFRESH
+        """
+        self.scorer = scorer
+        self.get_candidates = get_candidates
+        self.sign = sign
+        self.by_pvalue = by_pvalue
+        self.highest = highest
+        self.refresh = refresh or self.REFRESH
+        self.full_refresh = self.FULL_REFRESH if full_refresh is None else full_refresh
+        self.heap = []
+        self.picks_number = 0
+        self.scored_number = 0
+
+    def pick(self, text_counts, remaining):
+        """
+        Picks best chunk for text.
+        :param text_counts: counts vector of text
+        :param remaining: numpy array, how many times each chunk is left in text
+        :return: index of picked chunk or None
+        """
+        if not self.picks_number or (self.full_refresh and not self.picks_number % self.full_refresh):
+            self.heap = []
+            self._push(text_counts, self.get_candidates(remaining))
+        else:
+            while self.heap and self.heap[0][2] != self.picks_number:
+                indexes = []
+                while self.heap and self.heap[0][2] != self.picks_number and len(indexes) < self.refresh:
+                    indexes.append(heapq.heappop(self.heap)[1])
+                self._push(text_counts, np.array(indexes, dtype=np.int64))
+        self.picks_number += 1
+        if not self.heap:
+            return None
+
+        key, index, scored = heapq.heappop(self.heap)
+        if remaining[index] > 1:
+            # chunk is left in text after the pick, its score is rescored when it gets to the top again
+            heapq.heappush(self.heap, (key, index, -1))
+        return index
+
+    def _push(self, text_counts, indexes):
+        """
+        Scores chunks against current text and pushes them to heap. Equal scores are ordered by index, like the first
+        of equal chunks is picked by ChunksScorer.
+        """
+        if not len(indexes):
+            return
+        scores = self.scorer.score(text_counts, indexes, self.sign, self.by_pvalue, self.highest)
+        self.scored_number += len(indexes)
+        metrics.count('scored_candidates', len(indexes))
+        for score, index in zip(scores.tolist(), indexes.tolist()):
+            heapq.heappush(self.heap, (-score, index, self.picks_number))
+
+
+class SynthesisCheckpoint:
+    """
+    Class that saves state of synthesis to files and loads it, so a long synthesis can be resumed.
+    Parameters, chunks of text and their counts matrix are saved once to <file_name>.chunks, progress is saved to
+    <file_name> at most every interval seconds. Both are compressed .npz files, written to a temporary file that is
+    renamed when complete, so a killed run never leaves a broken checkpoint.
+    """
+    INTERVAL = 60
+    SEPARATOR = '\n'
+
+    def __init__(self, file_name, interval=None):
+        """
+        :param file_name: string, path to progress file
+        :param interval: float, min seconds between progress saves. Default: INTERVAL
+        """
+        self.file_name = file_name
+        self.chunks_file_name = file_name + '.chunks'
+        self.interval = self.INTERVAL if interval is None else interval
+        self.saved_at = time.monotonic()
+
+    def exists(self):
+        return os.path.isfile(self.file_name) and os.path.isfile(self.chunks_file_name)
+
+    def save_chunks(self, parameters, tokens_number, chunks, chunks_counts, chunks_multiplicity, chunks_rows,
+                    count_vectors):
+        """
+        :param parameters: dict of TextSynthesis arguments that define the synthesis
+        :param tokens_number: int, number of space separated tokens of text
+        :param chunks: list of unique chunks
+        :param chunks_counts: scipy.sparse.csr_matrix, counts vector of each chunk
+        :param chunks_multiplicity: numpy array, how many times each chunk is in text
+        :param chunks_rows: numpy array, index of every chunk of text in chunks, in text order, None when synthesis
+        doesn't keep them
+        :param count_vectors: PhonemeCountVectors
+        """
+        self._save(
+            self.chunks_file_name,
+            parameters=self._encode(json.dumps(parameters)),
+            tokens_number=tokens_number,
+            chunks=self._encode(self.SEPARATOR.join(chunks)),
+            data=chunks_counts.data,
+            indices=chunks_counts.indices,
+            indptr=chunks_counts.indptr,
+            shape=np.array(chunks_counts.shape),
+            chunks_multiplicity=chunks_multiplicity,
+            chunks_rows=chunks_rows if chunks_rows is not None else np.zeros(0, dtype=np.int32),
+            column_phonemes=self._encode(self.SEPARATOR.join(count_vectors.column_phonemes)),
+            column_groups=count_vectors.key_groups - count_vectors.keys_number,
+        )
+
+    def save_progress(self, progress, force=False):
+        """
+        Saves progress if interval passed since the last save.
+        :param progress: dict of arrays and numbers, see TextSynthesis._get_progress
+        :param force: bool, save even if interval didn't pass
+        """
+        if not force and time.monotonic() - self.saved_at < self.interval:
+            return
+        self._save(self.file_name, **progress)
+        self.saved_at = time.monotonic()
+
+    def load(self):
+        """
+        :return: tuple (parameters dict, chunks state dict, progress dict)
+        """
+        with np.load(self.chunks_file_name) as arrays:
+            parameters = json.loads(self._decode(arrays['parameters']))
+            chunks_counts = sparse.csr_matrix(
+                (arrays['data'], arrays['indices'], arrays['indptr']), shape=tuple(arrays['shape'].tolist())
+            )
+            chunks = self._decode(arrays['chunks']).split(self.SEPARATOR)
+            column_phonemes = self._decode(arrays['column_phonemes'])
+            chunks_state = {
+                'tokens_number': arrays['tokens_number'].item(),
+                'chunks': chunks,
+                'chunks_counts': chunks_counts,
+                'chunks_multiplicity': arrays['chunks_multiplicity'],
+                'chunks_rows': arrays['chunks_rows'] if len(arrays['chunks_rows']) else None,
+                'count_vectors': PhonemeCountVectors.from_columns(
+                    column_phonemes.split(self.SEPARATOR) if column_phonemes else [], arrays['column_groups'],
+                    parameters['phoneme_group_size']
+                ),
+            }
+        with np.load(self.file_name) as arrays:
+            progress = {key: arrays[key] for key in arrays.files}
+        return parameters, chunks_state, progress
+
+    def remove(self):
+        for file_name in (self.file_name, self.chunks_file_name):
+            if os.path.isfile(file_name):
+                os.remove(file_name)
+
+    @staticmethod
+    def _encode(text):
+        return np.frombuffer(text.encode('utf-8'), dtype=np.uint8)
+
+    @staticmethod
+    def _decode(values):
+        return values.tobytes().decode('utf-8')
+
+    @staticmethod
+    def _save(file_name, **arrays):
+        temp_file_name = file_name + '.tmp'
+        with open(temp_file_name, 'wb') as file:
+            np.savez_compressed(file, **arrays)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_file_name, file_name)
+
+
 class TextSynthesis:
     """
     Class that synthesises new text
@@ -259,25 +1097,111 @@ class TextSynthesis:
     DEFAULT_MODE = SENTENCE
     SYNTHESIS_APPEND = 'append'
     SYNTHESIS_DELETE = 'delete'
-    MAX_PHONEME_GROUP_SIZE = 3
+    SELECTION_EXHAUSTIVE = 'exhaustive'
+    SELECTION_LAZY = 'lazy'
 
     def __init__(
-            self, text, mode=None, p_value_level=0.7, distribution_criteria=None, synthesis_mode=None, phoneme_group_size=1
+            self, text, mode=None, p_value_level=0.7, distribution_criteria=None, synthesis_mode=None, phoneme_group_size=1,
+            phoneme_parser=None, workers=1, text_analyzer=None, selection=None, lazy_refresh=None, lazy_full_refresh=None,
+            time_budget=None, max_iterations=None, checkpoint_file=None, checkpoint_interval=None, checkpoint_state=None
     ):
-        self.text = self._normalize_text(text)
+        """
+        :param text_analyzer: TextAnalyzer got with TextSynthesis.analyze, to share one analysis of text between several
+        synthesis runs. Its phoneme_group_size should be at least phoneme_group_size. Text is taken from it if given.
+        :param selection: 'exhaustive' to score every candidate at every iteration, 'lazy' to pick with
+        LazyChunksSelector. Default: exhaustive
+        :param lazy_refresh: LazyChunksSelector refresh
+        :param lazy_full_refresh: LazyChunksSelector full_refresh
+        :param time_budget: float, seconds synthesis can run, then the best result found so far is returned.
+        Default: no limit
+        :param max_iterations: int, iterations synthesis can run, then the best result found so far is returned.
+        Default: no limit
+        :param checkpoint_file: string, file to save SynthesisCheckpoint to. Default: no checkpoints
+        :param checkpoint_interval: float, SynthesisCheckpoint interval
+        :param checkpoint_state: tuple (chunks state, progress) loaded from checkpoint, set by TextSynthesis.resume
+        """
         self.p_value_level = p_value_level
         self.mode = mode if mode in self.AVAILABLE_MODES else self.DEFAULT_MODE
-        self.phoneme_group_size = phoneme_group_size if phoneme_group_size <= self.MAX_PHONEME_GROUP_SIZE else 1
+        self.phoneme_group_size = phoneme_group_size if phoneme_group_size >= 1 else 1
         self.distribution_criteria = distribution_criteria if distribution_criteria in self.AVAILABLE_CRETERIAS else self.DEFAULT_CRETERIA
-        self.text_analyzer = TextAnalyzer(self.text)
-        self.initial_distribution = self._get_distribution(self.text)
+        self.synthesis_mode = synthesis_mode or self.SYNTHESIS_APPEND
+        self.resumed_progress = None
+        if checkpoint_state is not None:
+            chunks_state, self.resumed_progress = checkpoint_state
+            self.text_analyzer = None
+            self.initial_words = chunks_state['tokens_number']
+            self.count_vectors = chunks_state['count_vectors']
+            self.chunks = chunks_state['chunks']
+            self.chunks_counts = chunks_state['chunks_counts']
+            self.chunks_multiplicity = chunks_state['chunks_multiplicity']
+            self.chunks_rows = chunks_state['chunks_rows']
+        else:
+            self.text_analyzer = text_analyzer or self.analyze(text, phoneme_parser, self.phoneme_group_size)
+            self.initial_words = self.text_analyzer.tokens_number
+            with metrics.timer('chunks_matrix'):
+                self.count_vectors = PhonemeCountVectors(self.text_analyzer, self.phoneme_group_size)
+                self.chunks, self.chunks_counts, self.chunks_multiplicity, self.chunks_rows = (
+                    # only delete mode writes result in text order
+                    self.count_vectors.get_chunks_matrix(
+                        self.text_analyzer.tokens, self.mode == self.SENTENCE,
+                        self.synthesis_mode == self.SYNTHESIS_DELETE
+                    )
+                )
+        self.chunks_not_empty = np.array([bool(chunk) for chunk in self.chunks], dtype=bool)
+        self.initial_counts = self.chunks_counts.T.dot(self.chunks_multiplicity)
+        self.initial_distribution = self.count_vectors.get_distribution(self.initial_counts)
+        self.initial_values = self.count_vectors.get_values(self.initial_counts)
+        self.workers = workers
+        self.chunks_scorer = ChunksScorer(
+            self.chunks_counts, self.initial_values, self.count_vectors.key_groups, self.count_vectors.keys_number
+        )
         self.text_distribution = None
         self.result_text = None
         self.run_time = None
         self.iterations_number = 0
         self.test_p_value_level = 0
-        self.synthesis_mode = synthesis_mode or self.SYNTHESIS_APPEND
-        print('self.initial_distribution', self.initial_distribution)
+        self.selection = selection or self.SELECTION_EXHAUSTIVE
+        self.lazy_refresh = lazy_refresh
+        self.lazy_full_refresh = lazy_full_refresh
+        self.picked_chunks = []
+        self.time_budget = time_budget
+        self.max_iterations = max_iterations
+        self.budget_exhausted = False
+        self.stop_requested = False
+        self.last_p_value = 0.0
+        self.last_statistic = 1.0
+        self.checkpoint = SynthesisCheckpoint(checkpoint_file, checkpoint_interval) if checkpoint_file else None
+
+    @classmethod
+    def resume(cls, checkpoint_file, **options):
+        """
+        Restores synthesis from checkpoint without analyzing text again. synthesis() continues from the saved
+        iteration.
+        :param checkpoint_file: string, checkpoint file of synthesis run with checkpoint_file
+        :param options: other TextSynthesis arguments that don't change result, like workers, time_budget,
+        checkpoint_interval
+        :return: TextSynthesis
+        """
+        parameters, chunks_state, progress = SynthesisCheckpoint(checkpoint_file).load()
+        return cls(
+            text=None, checkpoint_file=checkpoint_file, checkpoint_state=(chunks_state, progress),
+            **dict(parameters, **options)
+        )
+
+    @classmethod
+    def analyze(cls, text, phoneme_parser=None, phoneme_group_size=1, keep_order=True):
+        """
+        Normalizes and analyzes text. The analysis can be shared by TextSynthesis of the same text with any
+        phoneme_group_size up to the given one.
+        :param text: string, initial text, or TextBlocks to read normalized text from file block by block
+        :param phoneme_parser: parser to get phonemes of words that are not saved
+        :param phoneme_group_size: int, max size of phoneme groups
+        :param keep_order: bool, False for analysis that is not used by TextSynthesis, see TextAnalyzer
+        :return: TextAnalyzer
+        """
+        if isinstance(text, str):
+            text = normalize_text(text)
+        return TextAnalyzer(text, phoneme_parser, phoneme_group_size, keep_order)
 
     def get_results(self):
         return {
@@ -285,8 +1209,8 @@ class TextSynthesis:
             'criteria': self.distribution_criteria,
             'p_value_level': self.p_value_level,
             'date': datetime.datetime.now().isoformat(),
-            'initial_words': len(self.text.split(' ')),
-            'result_words': len(self.result_text.split(' ')),
+            'initial_words': self.initial_words,
+            'result_words': self.result_text.count(' ') + 1,
             'initial_distribution': self.initial_distribution,
             'result_distribution': self.text_distribution,
             'run_time': str(self.run_time),
@@ -294,63 +1218,72 @@ class TextSynthesis:
             'synthesis_mode': self.synthesis_mode,
             'test_p_value_level': self.test_p_value_level,
             'phoneme_group_size': self.phoneme_group_size,
+            'budget_exhausted': self.budget_exhausted,
+            'metrics': metrics.get_summary(),
             'answer': self.result_text
         }
 
     def synthesis(self):
-        if self.synthesis_mode == self.SYNTHESIS_APPEND:
-            return self.synthesize_by_appending_chunks()
-        if self.synthesis_mode == self.SYNTHESIS_DELETE:
-            return self.synthesize_by_deleting_chunks()
-
-    def _get_distribution(self, chunk):
-        percentage = self.text_analyzer.get_percentage(chunk, 'single')
-        if self.phoneme_group_size >= 2:
-            percentage.update(self.text_analyzer.get_percentage(chunk, 'pairs'))
-        if self.phoneme_group_size == 3:
-            percentage.update(self.text_analyzer.get_percentage(chunk, 'triplets'))
-        return percentage
+        scorer = self.chunks_scorer
+        if self.workers > 1:
+            self.chunks_scorer = ParallelChunksScorer(scorer, self.workers)
+        if self.checkpoint and self.resumed_progress is None:
+            self._save_checkpoint_chunks()
+        try:
+            with metrics.timer('synthesis'):
+                if self.synthesis_mode == self.SYNTHESIS_APPEND:
+                    return self.synthesize_by_appending_chunks()
+                if self.synthesis_mode == self.SYNTHESIS_DELETE:
+                    return self.synthesize_by_deleting_chunks()
+        finally:
+            self.chunks_scorer.close()
+            self.chunks_scorer = scorer
 
     def synthesize_by_deleting_chunks(self):
         """
         Synthesizes result text by deleting chunks that are less relevant.
         At every step of te loop, the chunk that has furthest distribution from text's.
         This chunks is removed from text.
-        The loop ends when text's distribution is not relevant.
+        The loop ends when text's distribution is not relevant, or when the budget is exhausted. Text is relevant at
+        the start of every iteration, so it is the best result found so far.
         :return: string, result text
         """
-        text_list = self._text_to_list_by_mode()
-        unique_chunks = list(self._get_chunks_by_mode())
-        iterations_number = 0
-        while_start = datetime.datetime.now()
-        while self.text_is_relevant(' '.join(text_list)):
+        text_counts, remaining, iterations_number, while_start, best = self._start_loop(self.initial_counts)
+        selector = self._get_lazy_selector(-1, highest=self.distribution_criteria != self.PVALUE)
+        self.budget_exhausted = False
+        deadline = self._get_deadline()
+        trace = None
+        while self.text_is_relevant(text_counts):
+            self._trace(trace)
+            self._save_checkpoint(iterations_number, text_counts, while_start, best)
+            if self._is_budget_exhausted(iterations_number, deadline):
+                self.budget_exhausted = True
+                self._save_checkpoint(iterations_number, text_counts, while_start, best, force=True)
+                break
             iterations_number += 1
-            loop_start = datetime.datetime.now()
-            # text_distribution = self._get_distribution(' '.join(text_list))
-            worst_chunk = self.get_worst_chunk(unique_chunks, ' '.join(text_list))
-            # worst_chunk = self.get_worst_chunk(text_list, text_distribution)
-            if not worst_chunk:
+            loop_start = time.perf_counter()
+            with metrics.timer('candidate_scoring'):
+                if selector:
+                    worst_chunk_index = selector.pick(text_counts, remaining)
+                else:
+                    worst_chunk_index = self.get_worst_chunk(text_counts, self._get_candidates(remaining))
+            if worst_chunk_index is None:
                 break
-            text_list.remove(worst_chunk)
-            if worst_chunk not in text_list:
-                unique_chunks.remove(worst_chunk)
-
-            print('iteration', iterations_number)
-            print('time', datetime.datetime.now() - loop_start)
-            print('removing', worst_chunk)
+            self.picked_chunks.append(worst_chunk_index)
+            text_counts -= self.chunks_counts[worst_chunk_index].toarray()[0]
+            remaining[worst_chunk_index] -= 1
 
-        print('whole time', datetime.datetime.now() - while_start)
-        print('p_value_level', self.p_value_level)
-        print('distribution_criteria', self.distribution_criteria)
-        print('mode', self.mode)
-        # print('result', ' '.join(unique_chunks))
-        print('result', ' '.join(text_list))
+            trace = dict(
+                iteration=iterations_number, chunk=worst_chunk_index, seconds=time.perf_counter() - loop_start
+            )
+        else:
+            self._trace(trace)
 
         self.run_time = datetime.datetime.now() - while_start
         self.iterations_number = iterations_number
-        # self.result_text = ' '.join(unique_chunks)
-        self.result_text = ' '.join(text_list)
-        self.text_distribution = self._get_distribution(self.result_text)
+        self._finish_checkpoint()
+        self.result_text = self._get_remaining_text(self.chunks_multiplicity - remaining)
+        self.text_distribution = self.count_vectors.get_distribution(text_counts)
         return self.result_text
 
     def synthesize_by_appending_chunks(self):
@@ -358,164 +1291,261 @@ class TextSynthesis:
         Synthesizes result text by getting most relevant chunk from initial text.
         At every step of the loop, the chunk that has closest distribution to text's is picked.
         This chunk is added to result and removed from text.
-        The loop ends when the distribution of result is close to initial distribution
+        The loop ends when the distribution of result is close to initial distribution, or when the budget is
+        exhausted. Then result is cut to the picks that had the best p-value (lowest statistic for STATISTIC criteria),
+        which is kept at every iteration.
         :return: string, result text
         """
-        result_chunks = ''
-        text_list = self._text_to_list_by_mode()
-        unique_chunks = list(self._get_chunks_by_mode())
-        iterations_number = 0
-        while_start = datetime.datetime.now()
-
-        while not self.text_is_relevant(result_chunks):
+        result_counts, remaining, iterations_number, while_start, best = self._start_loop(self.count_vectors.empty())
+        selector = self._get_lazy_selector(1, highest=self.distribution_criteria == self.PVALUE)
+        self.budget_exhausted = False
+        deadline = self._get_deadline()
+        trace = None
+        while not self.text_is_relevant(result_counts):
+            self._trace(trace)
+            if self._is_better_result(best):
+                best = (self.last_p_value, self.last_statistic, len(self.picked_chunks), result_counts.copy())
+            self._save_checkpoint(iterations_number, result_counts, while_start, best)
+            if self._is_budget_exhausted(iterations_number, deadline):
+                self.budget_exhausted = True
+                self._save_checkpoint(iterations_number, result_counts, while_start, best, force=True)
+                self.test_p_value_level, _, best_picks_number, result_counts = best
+                self.picked_chunks = self.picked_chunks[:best_picks_number]
+                break
             iterations_number += 1
-            loop_start = datetime.datetime.now()
-            # text_distribution = self._get_distribution(' '.join(text_list))
-            best_chunk = self.get_best_chunk(unique_chunks, result_chunks)
-            # best_chunk = self.get_best_chunk(text_list, text_distribution)
-            if not best_chunk:
+            loop_start = time.perf_counter()
+            with metrics.timer('candidate_scoring'):
+                if selector:
+                    best_chunk_index = selector.pick(result_counts, remaining)
+                else:
+                    best_chunk_index = self.get_best_chunk(result_counts, self._get_candidates(remaining))
+            if best_chunk_index is None:
                 break
-            result_chunks += ' ' + best_chunk + '.'
+            self.picked_chunks.append(best_chunk_index)
+            result_counts += self.chunks_counts[best_chunk_index].toarray()[0]
+            remaining[best_chunk_index] -= 1
 
-            text_list.remove(best_chunk)
-            if best_chunk not in text_list:
-                unique_chunks.remove(best_chunk)
-
-            print('iteration', iterations_number)
-            print('time', datetime.datetime.now() - loop_start)
-            print('result', best_chunk)
-        print('whole time', datetime.datetime.now() - while_start)
-        print('p_value_level', self.p_value_level)
-        print('distribution_criteria', self.distribution_criteria)
-        print('mode', self.mode)
-        print('result', result_chunks)
+            trace = dict(
+                iteration=iterations_number, chunk=best_chunk_index, seconds=time.perf_counter() - loop_start
+            )
+        else:
+            self._trace(trace)
 
         self.run_time = datetime.datetime.now() - while_start
         self.iterations_number = iterations_number
-        self.result_text = result_chunks
-        self.text_distribution = self._get_distribution(self.result_text)
+        self._finish_checkpoint()
+        self.result_text = ''.join(' ' + self.chunks[index] + '.' for index in self.picked_chunks)
+        self.text_distribution = self.count_vectors.get_distribution(result_counts)
         return self.result_text
 
-    def get_best_chunk(self, chunks, text):
+    def _start_loop(self, counts):
         """
-        Gets most relevant chunk from chunks. Looks at self.distribution_criteria and picks the chunk that is fits best.
-        :param chunks: list of chunks
-        :param text_distribution: initial distribution to compare
-        :return: best chunk, string
-        """
-        chunks_ks_test = {}
-        highest_p_value = -1
-        highest_p_value_chunk = None
-        smallest_statistic = 2
-        smallest_statistic_chunk = None
-        for i, chunk in enumerate(chunks):
-            if not chunk:
-                continue
-
-            chunk_distribution = self._get_distribution(text + ' ' + chunk)
-
-            values_initial, values_chunk = self._get_values(self.initial_distribution, chunk_distribution)
-
-            ks_test = stats.ks_2samp(values_initial, values_chunk)
-            chunks_ks_test[i] = ks_test
-
-            if ks_test.statistic < smallest_statistic:
-                smallest_statistic = ks_test.statistic
-                smallest_statistic_chunk = chunk
-            if ks_test.pvalue > highest_p_value:
-                highest_p_value = ks_test.pvalue
-                highest_p_value_chunk = chunk
+        Returns state synthesis loop starts from, the initial one or the one resumed from checkpoint. Sets
+        self.picked_chunks.
+        :param counts: counts vector of text at the start of synthesis
+        :return: tuple (counts vector, remaining counts of chunks, iterations number, loop start time,
+        best result tuple (p-value, statistic, picks number, counts vector), picks number is 0 until the first pick)
+        """
+        progress, self.resumed_progress = self.resumed_progress, None
+        if progress is None:
+            self.picked_chunks = []
+            return (
+                counts.copy(), self.chunks_multiplicity.copy(), 0, datetime.datetime.now(),
+                (0.0, 1.0, 0, counts.copy())
+            )
+
+        self.picked_chunks = progress['picked_chunks'].tolist()
+        remaining = self.chunks_multiplicity - np.bincount(
+            progress['picked_chunks'], minlength=len(self.chunks_multiplicity)
+        )
+        self.test_p_value_level = progress['test_p_value_level'].item()
+        while_start = datetime.datetime.now() - datetime.timedelta(seconds=progress['run_time'].item())
+        best = (
+            progress['best_p_value'].item(), progress['best_statistic'].item(), progress['best_picks_number'].item(),
+            progress['best_counts']
+        )
+        return progress['counts'], remaining, progress['iterations_number'].item(), while_start, best
+
+    def _save_checkpoint_chunks(self):
+        self.checkpoint.save_chunks(
+            {
+                'mode': self.mode,
+                'distribution_criteria': self.distribution_criteria,
+                'p_value_level': self.p_value_level,
+                'synthesis_mode': self.synthesis_mode,
+                'phoneme_group_size': self.phoneme_group_size,
+            },
+            self.initial_words, self.chunks, self.chunks_counts, self.chunks_multiplicity, self.chunks_rows,
+            self.count_vectors
+        )
+
+    def _save_checkpoint(self, iterations_number, counts, while_start, best, force=False):
+        if not self.checkpoint:
+            return
+        best_p_value, best_statistic, best_picks_number, best_counts = best
+        self.checkpoint.save_progress({
+            'iterations_number': iterations_number,
+            'picked_chunks': np.array(self.picked_chunks, dtype=np.int64),
+            'counts': counts,
+            'run_time': (datetime.datetime.now() - while_start).total_seconds(),
+            'test_p_value_level': self.test_p_value_level,
+            'best_p_value': best_p_value,
+            'best_statistic': best_statistic,
+            'best_picks_number': best_picks_number,
+            'best_counts': best_counts,
+        }, force)
 
-        if self.distribution_criteria == self.PVALUE:
-            return highest_p_value_chunk
+    def _is_better_result(self, best):
+        """
+        Compares result of the last text_is_relevant with best result so far. Empty result is never better. Results are
+        compared by p-value with lower statistic on ties, or by statistic with higher p-value on ties for STATISTIC
+        criteria, so best result is kept when p-values underflow to 0.
+        :param best: best result tuple of _start_loop
+        :return: bool
+        """
+        best_p_value, best_statistic, best_picks_number, _ = best
+        if not self.picked_chunks:
+            return False
+        if not best_picks_number:
+            return True
         if self.distribution_criteria == self.STATISTIC:
-            return smallest_statistic_chunk
+            return (-self.last_statistic, self.last_p_value) > (-best_statistic, best_p_value)
+        return (self.last_p_value, -self.last_statistic) > (best_p_value, -best_statistic)
 
-    def get_worst_chunk(self, chunks, text):
+    def _finish_checkpoint(self):
+        """
+        Removes checkpoint of finished synthesis. Checkpoint of synthesis stopped by budget is kept to be resumed.
+        """
+        if self.checkpoint and not self.budget_exhausted:
+            self.checkpoint.remove()
+
+    def get_best_chunk(self, text_counts, indexes):
+        """
+        Gets most relevant chunk from chunks. Looks at self.distribution_criteria and picks the chunk that is fits best.
+        Chunk is scored by adding its counts vector to text's, so text is never parsed again.
+        :param text_counts: counts vector of text the chunk is added to
+        :param indexes: numpy array, indexes of candidate chunks in self.chunks
+        :return: index of best chunk in self.chunks or None
+        """
+        if not len(indexes):
+            return None
+        by_pvalue = self.distribution_criteria == self.PVALUE
+        metrics.count('scored_candidates', len(indexes))
+        score, index = self.chunks_scorer.pick(text_counts, indexes, 1, by_pvalue, highest=by_pvalue)
+        return index
+
+    def get_worst_chunk(self, text_counts, indexes):
         """
         Gets least relevant chunk from chunks. Looks at self.distribution_criteria and picks the chunk that is less
         relevant.
-        :param chunks: list of chunks
-        :param text: initial distribution to compare
-        :return: least relevant chunk, string
-        """
-        chunks_ks_test = {}
-        smallest_p_value = 2
-        smallest_p_value_chunk = None
-        highest_statistic = -1
-        highest_statistic_chunk = None
-        for i, chunk in enumerate(chunks):
-            if not chunk:
-                continue
-            chunk_distribution = self._get_distribution(text.replace(' ' + chunk + ' ', ' ', 1))
-
-            values_initial, values_chunk = self._get_values(self.initial_distribution, chunk_distribution)
-            ks_test = stats.ks_2samp(values_initial, values_chunk)
-            chunks_ks_test[i] = ks_test
+        Chunk removal is scored by subtracting its counts vector from text's, so text is never copied or parsed again.
+        :param text_counts: counts vector of text the chunk is removed from
+        :param indexes: numpy array, indexes of candidate chunks in self.chunks
+        :return: index of least relevant chunk in self.chunks or None
+        """
+        if not len(indexes):
+            return None
+        by_pvalue = self.distribution_criteria == self.PVALUE
+        metrics.count('scored_candidates', len(indexes))
+        score, index = self.chunks_scorer.pick(text_counts, indexes, -1, by_pvalue, highest=not by_pvalue)
+        return index
+
+    def _trace(self, trace):
+        """
+        Writes trace of the previous iteration, with p-value of text after its pick, which is tested at the start of
+        the next iteration.
+        :param trace: dict of values of the previous iteration, or None at the first iteration
+        """
+        if trace is not None:
+            metrics.trace(p_value=self.last_p_value, **trace)
 
-            if ks_test.statistic > highest_statistic:
-                highest_statistic = ks_test.statistic
-                highest_statistic_chunk = chunk
-            if ks_test.pvalue < smallest_p_value:
-                smallest_p_value = ks_test.pvalue
-                smallest_p_value_chunk = chunk
+    def _get_deadline(self):
+        """
+        :return: float, time.monotonic() time when time budget is exhausted, or None
+        """
+        if self.time_budget is None:
+            return None
+        return time.monotonic() + self.time_budget
 
-        if self.distribution_criteria == self.PVALUE:
-            return smallest_p_value_chunk
-        if self.distribution_criteria == self.STATISTIC:
-            return highest_statistic_chunk
+    def stop(self):
+        """
+        Asks running synthesis to stop, it can be called from another thread. Synthesis ends before its next iteration
+        as if budget was exhausted, with the best result found so far.
+        """
+        self.stop_requested = True
 
-    def _get_chunks_by_mode(self):
-        if self.mode == self.SENTENCE:
-            return set(self.text.split('.'))
-        if self.mode == self.WORD:
-            return self.text_analyzer.unique_phoneme_words.keys()
+    def _is_budget_exhausted(self, iterations_number, deadline):
+        if self.stop_requested:
+            return True
+        if self.max_iterations is not None and iterations_number >= self.max_iterations:
+            return True
+        return deadline is not None and time.monotonic() >= deadline
 
-    def _text_to_list_by_mode(self):
-        if self.mode == self.SENTENCE:
-            return self.text.split('.')
-        if self.mode == self.WORD:
-            return [get_normalized_word(word) for word in self.text.split(' ')]
+    def _get_lazy_selector(self, sign, highest):
+        """
+        :return: LazyChunksSelector if lazy selection is set, None otherwise
+        """
+        if self.selection != self.SELECTION_LAZY:
+            return None
+        return LazyChunksSelector(
+            self.chunks_scorer, self._get_candidates, sign, self.distribution_criteria == self.PVALUE, highest,
+            self.lazy_refresh, self.lazy_full_refresh
+        )
+
+    def _get_candidates(self, remaining):
+        """
+        :param remaining: numpy array, how many times each chunk is left in text
+        :return: numpy array, indexes of chunks that can be picked
+        """
+        return np.flatnonzero((remaining > 0) & self.chunks_not_empty)
 
-    def text_is_relevant(self, text):
+    def _get_remaining_text(self, removed):
+        """
+        Joins chunks of initial text in their order, skipping first removed[i] occurrences of chunk i, like removing
+        each of them with list.remove.
+        :param removed: numpy array, how many times each chunk was removed
+        :return: string
+        """
+        # occurrence number of every chunk of text among the same chunks, in text order
+        order = np.argsort(self.chunks_rows, kind='stable')
+        occurrences = np.empty(len(order), dtype=np.int64)
+        occurrences[order] = np.arange(len(order)) - np.repeat(
+            np.cumsum(self.chunks_multiplicity) - self.chunks_multiplicity, self.chunks_multiplicity
+        )
+        kept = self.chunks_rows[occurrences >= removed[self.chunks_rows]]
+        return ' '.join([self.chunks[row] for row in kept.tolist()])
+
+    def text_is_relevant(self, text_counts):
         """
         Compares distributions of given text and initial. Returns whether the text has similar distribution or not.
-        :param text: string
+        :param text_counts: counts vector of text
         :return: bool
         """
-        if not text:
+        self.last_statistic, self.last_p_value = self.get_ks_test(text_counts)
+        if not text_counts.any():
             return False
-        synthesis_text_distribution = self._get_distribution(text)
-        values_initial, values_chunk = self._get_values(self.initial_distribution, synthesis_text_distribution)
-        ks_test = stats.ks_2samp(values_initial, values_chunk)
-        print('compare to initial', ks_test.pvalue)
-        print('-------------------')
-        is_relevant = ks_test.pvalue >= self.p_value_level
+        is_relevant = self.last_p_value >= self.p_value_level
         if is_relevant:
-            self.test_p_value_level = ks_test.pvalue
+            self.test_p_value_level = self.last_p_value
         return is_relevant
 
-    def _normalize_text(self, text):
-        text = text.replace('?', '.')
-        text = text.replace('!', '.')
-        text = text.replace('.', '. ')
-
-        text = text.replace('\n', ' ')
-        text = text.replace('-', ' ')
-        text = re.sub('[^a-zA-Z0-9 .]', '', text).lower()
-        if text[-1] != '.':
-            text += '.'
-        return text
-
-    def _get_values(self, initial, chunk):
-        values_initial = []
-        values_chunk = []
-
-        for key in initial.keys():
-            values_initial.append(initial[key])
-            values_chunk.append(chunk.get(key, 0))
+    def get_p_value(self, text_counts):
+        """
+        :param text_counts: counts vector of text
+        :return: float, p-value of KS test of text distribution against initial, 0 for empty text
+        """
+        return self.get_ks_test(text_counts)[1]
 
-        return values_initial, values_chunk
+    def get_ks_test(self, text_counts):
+        """
+        :param text_counts: counts vector of text
+        :return: tuple (statistic, p-value) of KS test of text distribution against initial, (1, 0) for empty text
+        """
+        if not text_counts.any():
+            return 1.0, 0.0
+        values_chunk = self.count_vectors.get_values(text_counts)
+        statistics, pvalues = ks_2samp_batch(self.initial_values, values_chunk[np.newaxis])
+        return statistics[0].item(), pvalues[0].item()
 
 
 class Word:
@@ -526,10 +1556,44 @@ class Word:
     PROLONGATION_PHONEME = 'ː'
     SKIP_PHONEMES = ['ˈ', 'ˌ']
 
-    def __init__(self, text, transcription):
+    # changes when parsing changes, so phoneme groups counts saved by SavedWordNgrams are parsed again
+    PARSE_VERSION = 1
+
+    __slots__ = ('text', 'transcription', 'phoneme_ids', 'phoneme_counts')
+
+    def __init__(self, text, transcription, vocabulary, phoneme_group_size=3):
+        """
+        :param text: string, word
+        :param transcription: string, word transcription
+        :param vocabulary: PhonemeVocabulary to get ids of word phoneme groups
+        :param phoneme_group_size: int, max size of phoneme groups to count
+        """
         self.text = text
-        self.transcription = [phoneme for phoneme in transcription if phoneme not in self.SKIP_PHONEMES]
-        self.phonemes_dict = self.parse_phonemes_dict()
+        self.transcription = ''.join(phoneme for phoneme in transcription if phoneme not in self.SKIP_PHONEMES)
+
+        counts = {}
+        for group_index, group in self.get_phoneme_groups(phoneme_group_size):
+            phoneme_id = vocabulary.get_id(group_index, group)
+            counts[phoneme_id] = counts.get(phoneme_id, 0) + 1
+        self.phoneme_ids = np.array(list(counts.keys()), dtype=np.int32)
+        self.phoneme_counts = np.array(list(counts.values()), dtype=np.int32)
+
+    @classmethod
+    def from_counts(cls, text, transcription, phoneme_ids, phoneme_counts):
+        """
+        Creates Word of already counted phoneme groups, without parsing transcription.
+        :param text: string, word
+        :param transcription: string, word transcription
+        :param phoneme_ids: numpy array, vocabulary ids of phoneme groups
+        :param phoneme_counts: numpy array, count of each phoneme group
+        :return: Word
+        """
+        word = cls.__new__(cls)
+        word.text = text
+        word.transcription = ''.join(phoneme for phoneme in transcription if phoneme not in cls.SKIP_PHONEMES)
+        word.phoneme_ids = phoneme_ids.astype(np.int32)
+        word.phoneme_counts = phoneme_counts.astype(np.int32)
+        return word
 
     def get_text(self):
         return self.text
@@ -537,22 +1601,47 @@ class Word:
     def get_transcription(self):
         return self.transcription
 
+    def get_phonemes_dict(self, vocabulary):
+        return vocabulary.decode(self.phoneme_ids, self.phoneme_counts)
+
+    def get_phonemes(self):
+        """
+        Splits transcription to phonemes. Prolongation mark is part of the phoneme before it.
+        example: "nurse" (nɜːs): ['n', 'ɜː', 's']
+        :return: list of phonemes
+        """
+        phonemes = []
+        for char in self.transcription:
+            if char != self.PROLONGATION_PHONEME:
+                phonemes.append(char)
+            elif phonemes and not phonemes[-1].endswith(self.PROLONGATION_PHONEME):
+                phonemes[-1] += char
+        return phonemes
+
     def get_phonemes_count(self):
         info = {}
-        for i, phoneme in enumerate(self.transcription):
-            if phoneme in self.SKIP_PHONEMES:
-                continue
-
-            if self._is_next_phoneme_prolongation(i):
-                phoneme += self.PROLONGATION_PHONEME
+        for phoneme in self.get_phonemes():
             info[phoneme] = info.get(phoneme, 0) + 1
-
         return info
 
-    def parse_phonemes_dict(self):
+    def get_phoneme_groups(self, phoneme_group_size):
+        """
+        Returns every phoneme group of sizes 1..phoneme_group_size in one pass of a sliding window over phonemes.
+        :param phoneme_group_size: int, max size of group
+        :return: generator of tuples (group_index, group), group_index is group size - 1
         """
-        Returns dict with number of each phoneme, phonemes pair, phoneme triplet in given word. Notice that ':' is part
-        of phoneme.
+        phonemes = self.get_phonemes()
+        phonemes_number = len(phonemes)
+        for i in range(phonemes_number):
+            group = ''
+            for group_index in range(min(phoneme_group_size, phonemes_number - i)):
+                group += phonemes[i + group_index]
+                yield group_index, group
+
+    def parse_phonemes_dict(self, phoneme_group_size=3):
+        """
+        Returns dict with number of each phoneme, phonemes pair, phoneme triplet (and bigger groups, up to
+        phoneme_group_size) in given word. Notice that ':' is part of phoneme.
         ' and ˌ are skipped.
 
         examples:
@@ -560,46 +1649,15 @@ class Word:
         "test": {
             'pairs': {'st': 1, 'ɛs': 1, 'tɛ': 1}, 'triplets': {'tɛs': 1, 'ɛst': 1}, 'single': {'s': 1, 't': 2, 'ɛ': 1}
         }
+        :param phoneme_group_size: int, max size of group
         :return: dict
         """
-        phonemes_dict = {
-            'single': dict(),
-            'pairs': dict(),
-            'triplets': dict()
-        }
-
-        for i, phoneme in enumerate(self.transcription):
-            if phoneme == self.PROLONGATION_PHONEME:
-                continue
-
-            if self._is_next_phoneme_prolongation(i):
-                phoneme += self.PROLONGATION_PHONEME
-                i = i + 1
-
-            phonemes_dict['single'][phoneme] = phonemes_dict['single'].get(phoneme, 0) + 1
-
-            if self._next_phoneme_exists(i):
-                pair = phoneme + self._next_phoneme(i)
-                phonemes_dict['pairs'][pair] = phonemes_dict['pairs'].get(pair, 0) + 1
-
-                if self._next_phoneme_exists(i+1):
-                    triplet = pair + self._next_phoneme(i+1)
-                    phonemes_dict['triplets'][triplet] = phonemes_dict['triplets'].get(triplet, 0) + 1
+        phonemes_dict = {get_phoneme_group_name(i): dict() for i in range(phoneme_group_size)}
+        for group_index, group in self.get_phoneme_groups(phoneme_group_size):
+            group_counts = phonemes_dict[get_phoneme_group_name(group_index)]
+            group_counts[group] = group_counts.get(group, 0) + 1
         return phonemes_dict
 
-    def _next_phoneme(self, current_index):
-        n = 2 if self._is_next_phoneme_prolongation(current_index) else 1
-        phoneme = self.transcription[current_index + n]
-        return phoneme + self.PROLONGATION_PHONEME if self._is_next_phoneme_prolongation(current_index + n) else phoneme
-
-    def _next_phoneme_exists(self, current_index):
-        if current_index == len(self.transcription) - 2 and self.transcription[-1] == self.PROLONGATION_PHONEME:
-            return False
-        return current_index < len(self.transcription) - 1
-
-    def _is_next_phoneme_prolongation(self, current_index):
-        return self._next_phoneme_exists(current_index) and self.transcription[current_index + 1] == self.PROLONGATION_PHONEME
-
 
 def get_dicts_values(initial, chunk):
     values_initial = []
@@ -614,8 +1672,10 @@ def get_dicts_values(initial, chunk):
 
 
 def compare_two_texts(text1, text2):
-    percentage1 = TextAnalyzer(text1).get_initial_percentage()
-    percentage2 = TextAnalyzer(text2).get_initial_percentage()
+    from scipy import stats
+
+    percentage1 = TextAnalyzer(text1, keep_order=False).get_initial_percentage()
+    percentage2 = TextAnalyzer(text2, keep_order=False).get_initial_percentage()
 
     ks_test_single = stats.ks_2samp(get_dicts_values(percentage1['single'], percentage2['single']))
     ks_test_pairs = stats.ks_2samp(get_dicts_values(percentage1['pairs'], percentage2['pairs']))
@@ -638,13 +1698,69 @@ def compare_two_texts(text1, text2):
     print('pairs statistic', ks_test_pairs.statistic)
     print('triplets statistic', ks_test_triplets.statistic)
 
-time_tracker = {}
+KS_BATCH_SIZE = 2 ** 22
+ks_tests = {}
+
+
+def get_ks_test(samples_size, distance):
+    """
+    Returns two-sample KS test result for two samples of the same size. The result depends only on the statistic,
+    which is distance / samples_size, so it is got once from stats.ks_2samp for two shifted ranges and cached.
+    :param samples_size: int, size of each sample
+    :param distance: int, statistic multiplied by samples_size
+    :return: stats.ks_2samp result
+    """
+    key = (samples_size, distance)
+    if key not in ks_tests:
+        # scipy.stats takes long to import, it is loaded with the first test
+        from scipy import stats
 
+        sample = np.arange(samples_size)
+        ks_tests[key] = stats.ks_2samp(sample, sample + distance)
+    return ks_tests[key]
 
-def track_start(name):
-    time_tracker[name] = datetime.datetime.now()
 
+def ks_2samp_batch(values_initial, values_chunks):
+    """
+    Two-sample KS test of initial values against every row of values_chunks at once. Results match stats.ks_2samp
+    within float tolerance.
+    :param values_initial: list or 1-D array of n values
+    :param values_chunks: 2-D array, one row of n values per chunk
+    :return: tuple (statistics, pvalues) of 1-D arrays, one value per row
+    """
+    with metrics.timer('ks_tests'):
+        return _ks_2samp_batch(values_initial, values_chunks)
+
+
+def _ks_2samp_batch(values_initial, values_chunks):
+    values_initial = np.asarray(values_initial, dtype=np.float64)
+    values_chunks = np.asarray(values_chunks, dtype=np.float64)
+    metrics.count('ks_tests', values_chunks.shape[0])
+    samples_size = values_initial.shape[0]
+    rows_number = values_chunks.shape[0]
+    statistics = np.zeros(rows_number)
+    if not samples_size:
+        return statistics, np.ones(rows_number)
+
+    # rows are tested in blocks to keep memory of the sorted 2 * n values per row bounded
+    block_size = max(1, KS_BATCH_SIZE // (2 * samples_size))
+    is_initial = np.concatenate([np.ones(samples_size, dtype=bool), np.zeros(samples_size, dtype=bool)])
+    for start in range(0, rows_number, block_size):
+        block = values_chunks[start:start + block_size]
+        values_all = np.concatenate([np.broadcast_to(values_initial, block.shape), block], axis=1)
+        order = np.argsort(values_all, axis=1, kind='stable')
+        values_all = np.take_along_axis(values_all, order, axis=1)
+        sorted_is_initial = is_initial[order]
+        cdf_initial = np.cumsum(sorted_is_initial, axis=1) / samples_size
+        cdf_chunk = np.cumsum(~sorted_is_initial, axis=1) / samples_size
+        cdf_diffs = cdf_initial - cdf_chunk
+        # like np.searchsorted(side='right'), cdf is taken only after the last of equal values
+        cdf_diffs[:, :-1][values_all[:, :-1] == values_all[:, 1:]] = 0
+        statistics[start:start + block_size] = np.abs(cdf_diffs).max(axis=1)
+
+    distances, indexes = np.unique(np.rint(statistics * samples_size).astype(np.int64), return_inverse=True)
+    ks_results = [get_ks_test(samples_size, distance) for distance in distances.tolist()]
+    statistics = np.array([ks_test.statistic for ks_test in ks_results])
+    pvalues = np.array([ks_test.pvalue for ks_test in ks_results])
+    return statistics[indexes], pvalues[indexes]
 
-def track_stop(name):
-    time_start = time_tracker.get(name)
-    print('{}: {}'.format(name, datetime.datetime.now() - time_start))
@@ -0,0 +1,99 @@
+import hashlib
+import json
+import os
+from lexicon import SavedPhonemeWords
+from text_blocks import normalize_text
+
+
+class ResultCache:
+    """
+    Content addressed cache of synthesis results. Key is a hash of normalized text, synthesis parameters (with the
+    name of phoneme parser), lexicon file and source of CODE_MODULES, so a result is reused only for the same text,
+    parameters, transcriptions and code. Every result is a JSON file
+    in directory; when files take more than max_size bytes, least recently used ones are removed.
+    """
+    MAX_SIZE = 256 * 2 ** 20
+    # modules that change results, read as files so transcription backends are not imported
+    CODE_MODULES = ('phoneme_parser', 'text_blocks', 'transcription', 'http_transcription')
+
+    def __init__(self, directory, max_size=None):
+        """
+        :param directory: string, directory of cached results
+        :param max_size: int, max bytes of all cached results. Default: MAX_SIZE
+        """
+        self.directory = directory
+        self.max_size = max_size or self.MAX_SIZE
+
+    @classmethod
+    def get_code_version(cls):
+        version = hashlib.sha256()
+        directory = os.path.dirname(os.path.abspath(__file__))
+        for module in cls.CODE_MODULES:
+            with open(os.path.join(directory, module + '.py'), "rb") as source:
+                version.update(source.read())
+        return version.hexdigest()
+
+    @classmethod
+    def get_key(cls, text, parameters):
+        """
+        :param text: TextBlocks or string, initial text
+        :param parameters: dict of parameters that change result, with name of phoneme parser
+        :return: string, hex digest
+        """
+        key = hashlib.sha256()
+        key.update(cls.get_code_version().encode('utf-8'))
+        key.update(json.dumps(parameters, sort_keys=True).encode('utf-8'))
+        # words are transcribed once and read from the lexicon file later, so results depend on which file it is
+        key.update(os.path.abspath(SavedPhonemeWords.FILE_NAME).encode('utf-8'))
+        blocks = (normalize_text(text),) if isinstance(text, str) else text
+        for block in blocks:
+            key.update(block.encode('utf-8'))
+        return key.hexdigest()
+
+    def get(self, key):
+        """
+        :param key: string, key of get_key
+        :return: dict of TextSynthesis.get_results, or None if it is not cached
+        """
+        file_name = self._get_file_name(key)
+        try:
+            with open(file_name, "r") as file:
+                results = json.load(file)
+        except (OSError, ValueError):
+            return None
+        # modification time is the last use time for eviction
+        os.utime(file_name)
+        return results
+
+    def put(self, key, results):
+        """
+        :param key: string, key of get_key
+        :param results: dict of TextSynthesis.get_results
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        file_name = self._get_file_name(key)
+        with open(file_name + '.tmp', "w") as file:
+            json.dump(results, file)
+        os.replace(file_name + '.tmp', file_name)
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.json'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+        size = sum(entry_size for mtime, entry_size, path in entries)
+        # the most recent result is kept even if it is bigger than max_size
+        for mtime, entry_size, path in entries[:-1]:
+            if size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            size -= entry_size
+
+    def _get_file_name(self, key):
+        return os.path.join(self.directory, key + '.json')
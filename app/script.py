@@ -1,48 +1,180 @@
-from export import SpreadsheetExport
+from export import SpreadsheetExport, JSONExport, ReportWriter, get_phonemes_num
 from phoneme_parser import TextSynthesis
+from text_blocks import normalize_text
+from transcription import get_phoneme_parser
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import traceback
 
 
-if __name__ == '__main__':
-    file = open('app/Airport-Arthur_Hailey.txt', "r")
-    text = file.read()
+MODES = (TextSynthesis.WORD, TextSynthesis.SENTENCE)
+CRITERIAS = (TextSynthesis.PVALUE, TextSynthesis.STATISTIC)
+SYNTHESIS_MODES = (TextSynthesis.SYNTHESIS_APPEND, TextSynthesis.SYNTHESIS_DELETE)
+PHONEME_GROUP_SIZES = (1, 2, 3)
+SWEEP_ID_LENGTH = 12
+
+PARAMETERS = [
+    {'mode': mode, 'distribution_criteria': criteria, 'synthesis_mode': synthesis_mode, 'phoneme_group_size': group_size}
+    for mode, criteria, synthesis_mode, group_size in itertools.product(
+        MODES, CRITERIAS, SYNTHESIS_MODES, PHONEME_GROUP_SIZES
+    )
+]
+
+text_analyzer = None
+
+
+def init_sweep_worker(analyzer):
+    """
+    Keeps the analysis of initial text shared by every configuration the worker runs.
+    """
+    global text_analyzer
+    text_analyzer = analyzer
+
+
+def get_sweep_id(text, p_value_level):
+    """
+    :param text: string, initial text
+    :param p_value_level: float
+    :return: string, short hex digest of normalized text and p_value_level, so reports of sweeps of other texts or
+    p-values in the same directory are never taken for finished configurations
+    """
+    key = hashlib.sha256()
+    key.update(repr(float(p_value_level)).encode('utf-8'))
+    key.update(normalize_text(text).encode('utf-8'))
+    return key.hexdigest()[:SWEEP_ID_LENGTH]
+
 
-    PARAMETERS = [
-        # {'text': text, 'mode': 'word', 'distribution_criteria': 'pvalue', 'synthesis_mode': 'append', 'phoneme_group_size': 1},
-        # {'text': text, 'mode': 'word', 'distribution_criteria': 'pvalue', 'synthesis_mode': 'append', 'phoneme_group_size': 2},
-        # {'text': text, 'mode': 'word', 'distribution_criteria': 'pvalue', 'synthesis_mode': 'append', 'phoneme_group_size': 3},
+def get_report_name(params, sweep_id):
+    return 'synthesis_by_{}_{}_by_{}_{}_{}'.format(
+        params['mode'], params['synthesis_mode'], params['distribution_criteria'],
+        get_phonemes_num(params['phoneme_group_size']), sweep_id
+    )
 
-        {'text': text, 'mode': 'word', 'distribution_criteria': 'pvalue', 'synthesis_mode': 'delete', 'phoneme_group_size': 1},
-        #{'text': text, 'mode': 'word', 'distribution_criteria': 'pvalue', 'synthesis_mode': 'delete', 'phoneme_group_size': 2},
-        #{'text': text, 'mode': 'word', 'distribution_criteria': 'pvalue', 'synthesis_mode': 'delete', 'phoneme_group_size': 3},
 
-        # {'text': text, 'mode': 'word', 'distribution_criteria': 'statistic', 'synthesis_mode': 'append', 'phoneme_group_size': 1},
-        #{'text': text, 'mode': 'word', 'distribution_criteria': 'statistic', 'synthesis_mode': 'append', 'phoneme_group_size': 2},
-        #{'text': text, 'mode': 'word', 'distribution_criteria': 'statistic', 'synthesis_mode': 'append', 'phoneme_group_size': 3},
+def run_configuration(params, p_value_level):
+    """
+    Synthesizes text with one configuration.
+    :param params: dict of TextSynthesis arguments
+    :param p_value_level: float
+    :return: dict of TextSynthesis.get_results
+    """
+    text_synth = TextSynthesis(text=None, p_value_level=p_value_level, text_analyzer=text_analyzer, **params)
+    text_synth.synthesis()
+    return text_synth.get_results()
 
-        # {'text': text, 'mode': 'word', 'distribution_criteria': 'statistic', 'synthesis_mode': 'delete', 'phoneme_group_size': 1},
-        #{'text': text, 'mode': 'word', 'distribution_criteria': 'statistic', 'synthesis_mode': 'delete', 'phoneme_group_size': 2},
-        #{'text': text, 'mode': 'word', 'distribution_criteria': 'statistic', 'synthesis_mode': 'delete', 'phoneme_group_size': 3},
 
+def save_reports(name, results, reports_dir):
+    """
+    Saves reports of one configuration. JSON report is written last, under a temporary name that is renamed when it
+    is complete, so its existence marks the configuration as finished.
+    """
+    answer_file_name = os.path.join(reports_dir, name + '.answer.txt.gz')
+    SpreadsheetExport(data=results, file_name=os.path.join(reports_dir, name + '.xlsx'), answer_file_name=answer_file_name).save()
+    json_file_name = os.path.join(reports_dir, name + '.json')
+    JSONExport(data=results, file_name=json_file_name + '.tmp', answer_file_name=answer_file_name, save_answer=False).save()
+    os.replace(json_file_name + '.tmp', json_file_name)
+    print('finished', name)
 
-        # {'text': text, 'mode': 'sentence', 'distribution_criteria': 'pvalue', 'synthesis_mode': 'append', 'phoneme_group_size': 1},
-        # {'text': text, 'mode': 'sentence', 'distribution_criteria': 'pvalue', 'synthesis_mode': 'append', 'phoneme_group_size': 2},
-        #{'text': text, 'mode': 'sentence', 'distribution_criteria': 'pvalue', 'synthesis_mode': 'append', 'phoneme_group_size': 3},
 
-        # {'text': text, 'mode': 'sentence', 'distribution_criteria': 'pvalue', 'synthesis_mode': 'delete', 'phoneme_group_size': 1},
-        #{'text': text, 'mode': 'sentence', 'distribution_criteria': 'pvalue', 'synthesis_mode': 'delete', 'phoneme_group_size': 2},
-        #{'text': text, 'mode': 'sentence', 'distribution_criteria': 'pvalue', 'synthesis_mode': 'delete', 'phoneme_group_size': 3},
+def save_configuration_reports(name, results, reports_dir):
+    """
+    Saves reports of one configuration, errors are reported so reports of other configurations are still saved.
+    :return: bool, if reports were saved
+    """
+    try:
+        save_reports(name, results, reports_dir)
+    except Exception:
+        print('failed to save reports of', name)
+        traceback.print_exc()
+        return False
+    return True
 
-        # {'text': text, 'mode': 'sentence', 'distribution_criteria': 'statistic', 'synthesis_mode': 'append', 'phoneme_group_size': 1},
-        #{'text': text, 'mode': 'sentence', 'distribution_criteria': 'statistic', 'synthesis_mode': 'append', 'phoneme_group_size': 2},
-        #{'text': text, 'mode': 'sentence', 'distribution_criteria': 'statistic', 'synthesis_mode': 'append', 'phoneme_group_size': 3},
 
-        # {'text': text, 'mode': 'sentence', 'distribution_criteria': 'statistic', 'synthesis_mode': 'delete', 'phoneme_group_size': 1},
-        #{'text': text, 'mode': 'sentence', 'distribution_criteria': 'statistic', 'synthesis_mode': 'delete', 'phoneme_group_size': 2},
-        #{'text': text, 'mode': 'sentence', 'distribution_criteria': 'statistic', 'synthesis_mode': 'delete', 'phoneme_group_size': 3},
+def save_sweep_lines(parameters, sweep_id, reports_dir):
+    """
+    Writes sweep.jsonl again from JSON reports of finished configurations of the sweep, one line per configuration in
+    parameters order, so reruns of an interrupted sweep never duplicate lines.
+    """
+    os.makedirs(reports_dir, exist_ok=True)
+    file_name = os.path.join(reports_dir, 'sweep.jsonl')
+    with open(file_name + '.tmp', "w") as sweep_file:
+        for params in parameters:
+            json_file_name = os.path.join(reports_dir, get_report_name(params, sweep_id) + '.json')
+            if os.path.isfile(json_file_name):
+                with open(json_file_name, "r") as json_file:
+                    json.dump(json.load(json_file), sweep_file, sort_keys=True)
+                sweep_file.write('\n')
+    os.replace(file_name + '.tmp', file_name)
+
+
+def run_sweep(text, parameters, p_value_level=0.7, reports_dir='reports', workers=None, phoneme_parser=None):
+    """
+    Runs every configuration in a pool of processes. Text is analyzed once, with the biggest phoneme group size,
+    and the analysis is sent to every worker. Report names end with get_sweep_id of text and p_value_level;
+    configurations that already have JSON report of the same sweep in reports_dir are skipped, so an interrupted
+    sweep is resumed by running it again. A configuration that fails is reported and the other ones keep running;
+    sweep.jsonl is written from JSON reports of the sweep at the end.
+    :param text: string, initial text
+    :param parameters: list of dicts of TextSynthesis arguments (mode, distribution_criteria, synthesis_mode,
+    phoneme_group_size)
+    :param p_value_level: float
+    :param reports_dir: string, directory of reports
+    :param workers: int, number of processes. Default: number of CPUs
+    :param phoneme_parser: parser to get phonemes of words that are not saved
+    :return: list of report names of configurations that were run and saved
+    """
+    sweep_id = get_sweep_id(text, p_value_level)
+    pending = [
+        params for params in parameters
+        if not os.path.isfile(os.path.join(reports_dir, get_report_name(params, sweep_id) + '.json'))
     ]
+    for params in parameters:
+        if params not in pending:
+            print('skipping', get_report_name(params, sweep_id))
+    if not pending:
+        save_sweep_lines(parameters, sweep_id, reports_dir)
+        return []
+
+    analyzer = TextSynthesis.analyze(
+        text, phoneme_parser, max(params['phoneme_group_size'] for params in pending)
+    )
+    saves = {}
+    # reports are written by this process on a background thread, while workers synthesize next configurations
+    with ReportWriter() as report_writer:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_sweep_worker, initargs=(analyzer,)) as executor:
+            futures = {
+                executor.submit(run_configuration, params, p_value_level): get_report_name(params, sweep_id)
+                for params in pending
+            }
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    results = future.result()
+                except Exception:
+                    print('failed', name)
+                    traceback.print_exc()
+                    continue
+                saves[name] = report_writer.submit(save_configuration_reports, name, results, reports_dir)
+    save_sweep_lines(parameters, sweep_id, reports_dir)
+    return [name for name, save in saves.items() if save.result()]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Runs text synthesis with every configuration')
+    parser.add_argument('--file', dest='file', default='app/Airport-Arthur_Hailey.txt', help='Sets file to read from initial text. Default: app/Airport-Arthur_Hailey.txt')
+    parser.add_argument('--pvalue', type=float, dest='pvalue', default=0.7, help='Sets pvalue. Default: 0.7')
+    parser.add_argument('--reports', dest='reports', default='reports', help='Sets directory of reports. Default: reports')
+    parser.add_argument('--workers', type=int, dest='workers', default=None, help='Sets number of processes to run configurations. Default: number of CPUs')
+    parser.add_argument('--parser', dest='parser', default='espeak', help='Sets how new words are transcribed (espeak or http). Default: espeak')
+
+    args = parser.parse_args()
+    phoneme_parser = get_phoneme_parser(args.parser)
 
-    for params in PARAMETERS:
-        text_synth = TextSynthesis(**params)
+    with open(args.file, "r") as file:
+        text = file.read()
 
-        text_synth.synthesis()
-        SpreadsheetExport(data=text_synth.get_results()).save()
+    run_sweep(text, PARAMETERS, args.pvalue, args.reports, args.workers, phoneme_parser)
@@ -0,0 +1,475 @@
+from lexicon import SavedPhonemeWords
+from phoneme_parser import TextSynthesis
+from text_blocks import TextBlocks, normalize_text
+from transcription import get_phoneme_parser
+from concurrent.futures import ProcessPoolExecutor, CancelledError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from collections import OrderedDict
+import argparse
+import multiprocessing
+import hashlib
+import itertools
+import json
+import numbers
+import os
+import threading
+import time
+
+
+class AnalyzerCache:
+    """
+    LRU cache of TextAnalyzer of recently used texts. Key is a hash of normalized text, so the same text sent again, or
+    read from another file, is not analyzed again. Analyzer of a bigger phoneme_group_size is used for smaller ones.
+    """
+    MAX_SIZE = 8
+
+    def __init__(self, phoneme_parser=None, max_size=None):
+        """
+        :param phoneme_parser: parser to get phonemes of words that are not saved
+        :param max_size: int, max number of kept analyzers. Default: MAX_SIZE
+        """
+        self.phoneme_parser = phoneme_parser
+        self.max_size = max_size or self.MAX_SIZE
+        self.analyzers = OrderedDict()
+        self.lock = threading.Lock()
+        self.key_locks = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def get_key(text):
+        """
+        :param text: TextBlocks or string, initial text
+        :return: string, hex digest of normalized text
+        """
+        key = hashlib.sha256()
+        blocks = (normalize_text(text),) if isinstance(text, str) else text
+        for block in blocks:
+            key.update(block.encode('utf-8'))
+        return key.hexdigest()
+
+    def get(self, text, phoneme_group_size):
+        """
+        :param text: TextBlocks or string, initial text
+        :param phoneme_group_size: int, phoneme_group_size of synthesis
+        :return: TextAnalyzer
+        """
+        key = self.get_key(text)
+        with self.lock:
+            key_lock = self.key_locks.setdefault(key, threading.Lock())
+        # the same text is analyzed once even if several jobs of it come at once
+        with key_lock:
+            with self.lock:
+                text_analyzer = self.analyzers.get(key)
+                if text_analyzer is not None and text_analyzer.phoneme_group_size >= phoneme_group_size:
+                    self.analyzers.move_to_end(key)
+                    self.hits += 1
+                    return text_analyzer
+                self.misses += 1
+            text_analyzer = TextSynthesis.analyze(text, self.phoneme_parser, phoneme_group_size)
+            with self.lock:
+                self.analyzers[key] = text_analyzer
+                self.analyzers.move_to_end(key)
+                while len(self.analyzers) > self.max_size:
+                    evicted, _ = self.analyzers.popitem(last=False)
+                    self.key_locks.pop(evicted, None)
+            return text_analyzer
+
+    def get_summary(self):
+        with self.lock:
+            return {'size': len(self.analyzers), 'max_size': self.max_size, 'hits': self.hits, 'misses': self.misses}
+
+
+class Job:
+    """
+    Synthesis job of SynthesisService. Status is one of QUEUED, RUNNING, DONE, FAILED, CANCELLED.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+    MAX_PHONEME_GROUP_SIZE = 5
+    # TextSynthesis arguments a job can set, with allowed values: tuple of choices or (type, min, max), null is
+    # allowed for arguments that default to None
+    PARAMETERS = {
+        'mode': (TextSynthesis.WORD, TextSynthesis.SENTENCE, None),
+        'distribution_criteria': (TextSynthesis.PVALUE, TextSynthesis.STATISTIC, None),
+        'synthesis_mode': (TextSynthesis.SYNTHESIS_APPEND, TextSynthesis.SYNTHESIS_DELETE, None),
+        'selection': (TextSynthesis.SELECTION_EXHAUSTIVE, TextSynthesis.SELECTION_LAZY, None),
+        'p_value_level': (numbers.Real, 0, 1),
+        'phoneme_group_size': (numbers.Integral, 1, MAX_PHONEME_GROUP_SIZE),
+        'lazy_refresh': (numbers.Integral, 1, None),
+        'lazy_full_refresh': (numbers.Integral, 0, None),
+        'time_budget': (numbers.Real, 0, None),
+        'max_iterations': (numbers.Integral, 0, None),
+    }
+    OPTIONAL = ('lazy_refresh', 'lazy_full_refresh', 'time_budget', 'max_iterations')
+
+    def __init__(self, job_id, text, parameters, running):
+        """
+        :param job_id: string
+        :param text: TextBlocks or string, initial text
+        :param parameters: dict of TextSynthesis arguments, keys of PARAMETERS
+        :param running: shared dict of SynthesisService, job id -> progress of running jobs, written by workers
+        """
+        self.id = job_id
+        self.text = text
+        self.parameters = parameters
+        self.running = running
+        self.status = self.QUEUED
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.progress = None
+        self.results = None
+        self.error = None
+        self.future = None
+        self.cancel_requested = False
+        # status is set by request threads that see a job started and by the thread that finishes it
+        self.lock = threading.Lock()
+
+    @classmethod
+    def validate(cls, parameters):
+        """
+        Raises ValueError with a message about the first parameter that TextSynthesis would not accept.
+        :param parameters: dict of TextSynthesis arguments
+        """
+        for name, value in parameters.items():
+            allowed = cls.PARAMETERS.get(name)
+            if allowed is None:
+                raise ValueError('unknown parameter: {}'.format(name))
+            if not isinstance(allowed[0], type):
+                if value not in allowed:
+                    raise ValueError('{} should be one of: {}'.format(
+                        name, ', '.join(json.dumps(choice) for choice in allowed)
+                    ))
+                continue
+            if value is None and name in cls.OPTIONAL:
+                continue
+            value_type, minimum, maximum = allowed
+            # bool is a number in python, but not in JSON
+            if not isinstance(value, value_type) or isinstance(value, bool):
+                kind = 'an integer' if value_type is numbers.Integral else 'a number'
+                raise ValueError('{} should be {}'.format(name, kind))
+            if maximum is not None and not minimum <= value <= maximum:
+                raise ValueError('{} should be from {} to {}'.format(name, minimum, maximum))
+            if value < minimum:
+                raise ValueError('{} should be at least {}'.format(name, minimum))
+
+    def get_progress(self):
+        """
+        Progress of a running job is read from the worker, progress of a finished job is the last one of the worker.
+        Sets status and start time of a job that a worker started.
+        :return: dict with number of picked chunks and last p-value, or None if the job was not started
+        """
+        with self.lock:
+            if self.finished is not None:
+                return self.progress
+            progress = self.running.get(self.id)
+            if progress is not None and self.status == self.QUEUED:
+                self.status = self.RUNNING
+                self.started = progress['started']
+        if progress is None:
+            return None
+        return {'picked_chunks': progress['picked_chunks'], 'p_value': progress['p_value']}
+
+    def get_state(self, with_results=False):
+        progress = self.get_progress()
+        state = {
+            'id': self.id,
+            'status': self.status,
+            'parameters': self.parameters,
+            'created': self.created,
+            'started': self.started,
+            'finished': self.finished,
+            'progress': progress,
+            'error': self.error,
+        }
+        if with_results:
+            state['results'] = self.results
+        return state
+
+
+analyzer_cache = None
+
+
+def init_service_worker(parser_name, cache_size):
+    """
+    Keeps AnalyzerCache of the worker process, which jobs of the same text sent to this worker share. The lexicon
+    loaded by the service is inherited when processes are forked, and loaded again otherwise.
+    """
+    global analyzer_cache
+    if SavedPhonemeWords.memory is None:
+        SavedPhonemeWords.load_memory()
+    analyzer_cache = AnalyzerCache(get_phoneme_parser(parser_name), cache_size)
+
+
+def run_job_in_worker(job_id, text, parameters, running, cancels):
+    """
+    Runs synthesis of a job in a worker process. Progress is written to running and cancels are read from cancels
+    every PROGRESS_INTERVAL seconds by a watcher thread, while synthesis runs.
+    :return: tuple (dict of TextSynthesis.get_results or None if job was cancelled before synthesis, last progress,
+    bool if analysis was in worker AnalyzerCache)
+    """
+    progress = {'started': time.time(), 'picked_chunks': 0, 'p_value': 0.0}
+    running[job_id] = progress
+    hits = analyzer_cache.hits
+    text_analyzer = analyzer_cache.get(text, parameters.get('phoneme_group_size', 1))
+    cache_hit = analyzer_cache.hits > hits
+    if cancels.get(job_id):
+        return None, progress, cache_hit
+
+    text_synth = TextSynthesis(text=None, text_analyzer=text_analyzer, **parameters)
+    finished = threading.Event()
+
+    def watch():
+        while True:
+            if cancels.get(job_id):
+                text_synth.stop()
+            progress.update(picked_chunks=len(text_synth.picked_chunks), p_value=float(text_synth.last_p_value))
+            running[job_id] = progress
+            if finished.wait(SynthesisService.PROGRESS_INTERVAL):
+                break
+
+    watcher = threading.Thread(target=watch, daemon=True)
+    watcher.start()
+    try:
+        text_synth.synthesis()
+    finally:
+        finished.set()
+        watcher.join()
+    progress.update(picked_chunks=len(text_synth.picked_chunks), p_value=float(text_synth.last_p_value))
+    return text_synth.get_results(), progress, cache_hit
+
+
+class SynthesisService:
+    """
+    Runs synthesis jobs in a pool of worker processes, up to WORKERS jobs at once, in submit order. Every worker keeps
+    its own AnalyzerCache, so jobs of the same corpus that come to a worker again start synthesis right away; the
+    lexicon is loaded to memory once, before workers are started. Jobs without time_budget get MAX_TIME_BUDGET, so one
+    long job can't hold a worker forever. Finished jobs are kept until MAX_FINISHED_JOBS newer jobs finish.
+    """
+    WORKERS = 1
+    MAX_TIME_BUDGET = 600
+    MAX_FINISHED_JOBS = 100
+    PROGRESS_INTERVAL = 0.5
+
+    def __init__(self, parser_name='espeak', workers=None, cache_size=None, max_time_budget=None):
+        """
+        :param parser_name: string, get_phoneme_parser name of parser of words that are not saved
+        :param workers: int, number of processes that run jobs. Default: WORKERS
+        :param cache_size: int, AnalyzerCache max_size of every worker
+        :param max_time_budget: float, max time_budget of a job in seconds, 0 - no limit. Default: MAX_TIME_BUDGET
+        """
+        SavedPhonemeWords.load_memory()
+        self.workers = workers or self.WORKERS
+        self.cache_size = cache_size or AnalyzerCache.MAX_SIZE
+        self.max_time_budget = self.MAX_TIME_BUDGET if max_time_budget is None else max_time_budget
+        self.manager = multiprocessing.Manager()
+        # job id -> progress of jobs that workers started, job id -> True for jobs to cancel
+        self.running = self.manager.dict()
+        self.cancels = self.manager.dict()
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers, initializer=init_service_worker, initargs=(parser_name, self.cache_size)
+        )
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def submit(self, text=None, file_name=None, **parameters):
+        """
+        :param text: string, initial text
+        :param file_name: string, file of initial text, read block by block, if text is not given
+        :param parameters: TextSynthesis arguments, keys of Job.PARAMETERS
+        :return: Job
+        """
+        Job.validate(parameters)
+        if text is None and file_name is None:
+            raise ValueError('text or file is required')
+        if text is not None and not isinstance(text, str):
+            raise ValueError('text should be a string')
+        if text is None and (not isinstance(file_name, str) or not os.path.isfile(file_name)):
+            raise ValueError('file should be a path to an existing file')
+        if self.max_time_budget:
+            if parameters.get('time_budget') is None:
+                parameters['time_budget'] = self.max_time_budget
+            elif parameters['time_budget'] > self.max_time_budget:
+                raise ValueError('time_budget should be at most {}'.format(self.max_time_budget))
+        with self.lock:
+            job = Job(str(next(self.ids)), text if text is not None else TextBlocks(file_name), parameters, self.running)
+            self.jobs[job.id] = job
+            job.future = self.executor.submit(
+                run_job_in_worker, job.id, job.text, parameters, self.running, self.cancels
+            )
+        job.future.add_done_callback(lambda future: self._finish(job, future))
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def list(self):
+        with self.lock:
+            return list(self.jobs.values())
+
+    def cancel(self, job_id):
+        """
+        Cancels a queued job, or stops a running one, which then ends with the best result found so far.
+        :return: Job, or None if there is no such job
+        """
+        job = self.get(job_id)
+        if job is None or job.finished is not None:
+            return job
+        job.cancel_requested = True
+        if not job.future.cancel():
+            self.cancels[job.id] = True
+        return job
+
+    def get_summary(self):
+        jobs = self.list()
+        states = [job.get_state() for job in jobs]
+        return {
+            'jobs': {status: sum(1 for state in states if state['status'] == status) for status in (
+                Job.QUEUED, Job.RUNNING, Job.DONE, Job.FAILED, Job.CANCELLED
+            )},
+            'workers': self.workers,
+            'analyzer_cache': {
+                'max_size': self.cache_size, 'hits': self.cache_hits, 'misses': self.cache_misses
+            },
+            'lexicon_words': len(SavedPhonemeWords.memory or ()),
+        }
+
+    def close(self):
+        for job in self.list():
+            if job.finished is None:
+                self.cancel(job.id)
+        self.executor.shutdown(wait=True)
+        self.manager.shutdown()
+
+    def _finish(self, job, future):
+        # started time of a job that finished before its progress was read
+        job.get_progress()
+        status = Job.CANCELLED if job.cancel_requested else Job.DONE
+        results = progress = error = None
+        try:
+            results, progress, cache_hit = future.result()
+            with self.lock:
+                if cache_hit:
+                    self.cache_hits += 1
+                else:
+                    self.cache_misses += 1
+        except CancelledError:
+            pass
+        except Exception as e:
+            status = Job.FAILED
+            error = '{}: {}'.format(type(e).__name__, e)
+        with job.lock:
+            job.results, job.error, job.status = results, error, status
+            if progress is not None:
+                job.progress = {'picked_chunks': progress['picked_chunks'], 'p_value': progress['p_value']}
+            job.finished = time.time()
+        try:
+            self.running.pop(job.id, None)
+            self.cancels.pop(job.id, None)
+        except (OSError, EOFError):
+            # manager is already shut down when jobs are cancelled by close
+            pass
+        with self.lock:
+            finished = [job_id for job_id, other in self.jobs.items() if other.finished is not None]
+            for job_id in finished[:-self.MAX_FINISHED_JOBS]:
+                del self.jobs[job_id]
+
+
+class ServiceRequestHandler(BaseHTTPRequestHandler):
+    """
+    JSON API of SynthesisService:
+    POST /jobs - submits a job, body is {"text": ..., or "file": ..., and TextSynthesis arguments}
+    GET /jobs - states of all jobs
+    GET /jobs/<id> - state of a job, with results when it is done
+    DELETE /jobs/<id> - cancels a job
+    GET /status - jobs, analyzer cache and lexicon summary
+    """
+    service = None
+
+    def do_GET(self):
+        parts = self._get_path_parts()
+        if parts == ['status']:
+            return self._send(200, self.service.get_summary())
+        if parts == ['jobs']:
+            return self._send(200, [job.get_state() for job in self.service.list()])
+        if len(parts) == 2 and parts[0] == 'jobs':
+            job = self.service.get(parts[1])
+            if job is None:
+                return self._send(404, {'error': 'job not found'})
+            return self._send(200, job.get_state(with_results=True))
+        return self._send(404, {'error': 'not found'})
+
+    def do_POST(self):
+        if self._get_path_parts() != ['jobs']:
+            return self._send(404, {'error': 'not found'})
+        try:
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            try:
+                body = json.loads(body.decode('utf-8'))
+            except ValueError:
+                raise ValueError('request body should be JSON')
+            if not isinstance(body, dict):
+                raise ValueError('request body should be a JSON object')
+            text = body.pop('text', None)
+            file_name = body.pop('file', None)
+            job = self.service.submit(text=text, file_name=file_name, **body)
+        except ValueError as e:
+            return self._send(400, {'error': str(e)})
+        return self._send(202, job.get_state())
+
+    def do_DELETE(self):
+        parts = self._get_path_parts()
+        if len(parts) != 2 or parts[0] != 'jobs':
+            return self._send(404, {'error': 'not found'})
+        job = self.service.cancel(parts[1])
+        if job is None:
+            return self._send(404, {'error': 'job not found'})
+        return self._send(202, job.get_state())
+
+    def log_message(self, format, *args):
+        pass
+
+    def _get_path_parts(self):
+        return [part for part in self.path.split('?', 1)[0].split('/') if part]
+
+    def _send(self, code, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve(service, host='127.0.0.1', port=8765):
+    ServiceRequestHandler.service = service
+    server = ThreadingHTTPServer((host, port), ServiceRequestHandler)
+    print('serving on {}:{}'.format(host, port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Runs text synthesis jobs sent over localhost HTTP')
+    parser.add_argument('--host', dest='host', default='127.0.0.1', help='Sets address to listen on. Default: 127.0.0.1')
+    parser.add_argument('--port', type=int, dest='port', default=8765, help='Sets port to listen on. Default: 8765')
+    parser.add_argument('--workers', type=int, dest='workers', default=SynthesisService.WORKERS, help='Sets number of processes that run jobs at once. Default: 1')
+    parser.add_argument('--cache-size', type=int, dest='cache_size', default=AnalyzerCache.MAX_SIZE, help='Sets number of analyzed texts kept in memory by every worker. Default: 8')
+    parser.add_argument('--max-time-budget', type=float, dest='max_time_budget', default=SynthesisService.MAX_TIME_BUDGET, help='Sets max seconds of a job, jobs without time_budget get it, 0 - no limit. Default: 600')
+    parser.add_argument('--parser', dest='parser', default='espeak', help='Sets how new words are transcribed (espeak or http). Default: espeak')
+
+    args = parser.parse_args()
+    serve(SynthesisService(args.parser, args.workers, args.cache_size, args.max_time_budget), args.host, args.port)
@@ -0,0 +1,72 @@
+import re
+
+
+def iter_split_blocks(blocks, separator):
+    """
+    Works like ''.join(blocks).split(separator), but yields parts one by one and never joins the blocks. Parts that
+    cross blocks boundary are joined from the end of one block and the beginning of the next.
+    :param blocks: iterable of strings
+    :param separator: string
+    :return: generator of strings
+    """
+    rest = ''
+    for block in blocks:
+        parts = (rest + block).split(separator)
+        rest = parts.pop()
+        yield from parts
+    yield rest
+
+
+def normalize_text_block(text):
+    """
+    Replaces sentence ends with dots, removes all symbols except letters, digits, spaces and dots, and lowercases text.
+    Every symbol is replaced on its own, so text can be normalized block by block.
+    :param text: string
+    :return: string
+    """
+    text = text.replace('?', '.')
+    text = text.replace('!', '.')
+    text = text.replace('.', '. ')
+
+    text = text.replace('\n', ' ')
+    text = text.replace('-', ' ')
+    return re.sub('[^a-zA-Z0-9 .]', '', text).lower()
+
+
+def normalize_text(text):
+    """
+    Normalizes whole text, which always ends with a dot, like TextBlocks.
+    :param text: string
+    :return: string
+    """
+    text = normalize_text_block(text)
+    if text[-1] != '.':
+        text += '.'
+    return text
+
+
+class TextBlocks:
+    """
+    Normalized text of a file, read in blocks of BLOCK_SIZE characters, so the whole text is never in memory.
+    Can be iterated several times, every iteration reads the file again.
+    """
+    BLOCK_SIZE = 2 ** 20
+
+    def __init__(self, file_name, block_size=None):
+        """
+        :param file_name: string, path to text file
+        :param block_size: int, number of characters to read at once. Default: BLOCK_SIZE
+        """
+        self.file_name = file_name
+        self.block_size = block_size or self.BLOCK_SIZE
+
+    def __iter__(self):
+        last_char = ''
+        with open(self.file_name, "r") as file:
+            for block in iter(lambda: file.read(self.block_size), ''):
+                block = normalize_text_block(block)
+                if block:
+                    last_char = block[-1]
+                    yield block
+        if last_char != '.':
+            yield '.'
@@ -0,0 +1,58 @@
+from concurrent.futures import ThreadPoolExecutor
+from subprocess import check_output
+import os
+
+
+PARSERS = ('espeak', 'http')
+
+
+def get_phoneme_parser(name):
+    """
+    Creates parser of words that are not saved. HTTP parser module, with requests and bs4, is imported only when it
+    is selected.
+    :param name: string, 'espeak' or 'http'
+    :return: EspeakPhonemeParser or HttpPhonemeParser
+    """
+    if name == 'http':
+        from http_transcription import HttpPhonemeParser
+        return HttpPhonemeParser()
+    return EspeakPhonemeParser()
+
+
+class EspeakPhonemeParser:
+    """
+    Class that gets transcription for given text using espeak subprocess.
+    """
+    BATCH_SIZE = 50
+    # every word is a separate clause, so espeak doesn't join words and puts each of them on its own line
+    WORDS_SEPARATOR = '.\n'
+
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count() or 1
+
+    def text_to_phoneme(self, text):
+        return check_output(["espeak", "-q", "--ipa", '-v', 'en-us', text]).strip().decode('utf-8')
+
+    def words_to_phonemes(self, words):
+        """
+        Gets transcriptions of words. Words are sent to espeak in batches, several espeak processes run at once.
+        :param words: list of words
+        :return: generator of tuples (word, phoneme), batch by batch
+        """
+        batches = [words[i:i + self.BATCH_SIZE] for i in range(0, len(words), self.BATCH_SIZE)]
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for batch, phonemes in zip(batches, executor.map(self._batch_to_phonemes, batches)):
+                for word, phoneme in zip(batch, phonemes):
+                    yield word, phoneme
+
+    def _batch_to_phonemes(self, words):
+        """
+        Gets transcriptions of batch of words with one espeak call. If output lines can't be matched to the words,
+        every word is transcribed separately.
+        :param words: list of not empty words
+        :return: list of phonemes in words order
+        """
+        phonemes = [line.strip() for line in self.text_to_phoneme(self.WORDS_SEPARATOR.join(words)).split('\n')]
+        if len(phonemes) != len(words):
+            return [self.text_to_phoneme(word) for word in words]
+        return phonemes
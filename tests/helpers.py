@@ -0,0 +1,14 @@
+import os
+import sys
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+sys.path.insert(0, APP_DIR)
+
+
+class OfflinePhonemeParser:
+    """
+    Parser for tests, so espeak or network is never used. Every word gets its letters as transcription.
+    """
+    def words_to_phonemes(self, words):
+        for word in words:
+            yield word, word
@@ -0,0 +1,70 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from helpers import APP_DIR, OfflinePhonemeParser
+from phoneme_parser import SavedPhonemeWords, SynthesisCheckpoint, TextBlocks, TextSynthesis
+
+
+class CheckpointResumeTest(unittest.TestCase):
+    """
+    Synthesis stopped by a budget and resumed from its checkpoint picks the same chunks as one uninterrupted run.
+    """
+    ITERATIONS = 30
+    INTERRUPTED_AT = 10
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        cls.file_name = SavedPhonemeWords.FILE_NAME
+        SavedPhonemeWords.FILE_NAME = os.path.join(cls.directory, 'saved_phonemes.sqlite3')
+        cls.text_analyzer = TextSynthesis.analyze(
+            TextBlocks(os.path.join(APP_DIR, 'file.txt')), OfflinePhonemeParser(), 1
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        SavedPhonemeWords.FILE_NAME = cls.file_name
+        shutil.rmtree(cls.directory)
+
+    def assert_resume_is_equivalent(self, **parameters):
+        parameters = dict(text=None, text_analyzer=self.text_analyzer, **parameters)
+        checkpoint_file = os.path.join(self.directory, 'checkpoint')
+
+        full = TextSynthesis(max_iterations=self.ITERATIONS, **parameters)
+        full.synthesis()
+
+        interrupted = TextSynthesis(
+            max_iterations=self.INTERRUPTED_AT, checkpoint_file=checkpoint_file, checkpoint_interval=0, **parameters
+        )
+        interrupted.synthesis()
+        self.assertTrue(interrupted.budget_exhausted)
+        self.assertTrue(SynthesisCheckpoint(checkpoint_file).exists())
+
+        resumed = TextSynthesis.resume(checkpoint_file, max_iterations=self.ITERATIONS)
+        resumed.synthesis()
+        self.assertEqual(resumed.iterations_number, full.iterations_number)
+        self.assertEqual(resumed.picked_chunks, full.picked_chunks)
+        self.assertEqual(resumed.result_text, full.result_text)
+        self.assertEqual(resumed.test_p_value_level, full.test_p_value_level)
+        SynthesisCheckpoint(checkpoint_file).remove()
+
+    def test_word_append(self):
+        self.assert_resume_is_equivalent(
+            mode=TextSynthesis.WORD, synthesis_mode=TextSynthesis.SYNTHESIS_APPEND, p_value_level=0.9999
+        )
+
+    def test_word_delete(self):
+        self.assert_resume_is_equivalent(
+            mode=TextSynthesis.WORD, synthesis_mode=TextSynthesis.SYNTHESIS_DELETE, p_value_level=0.0001
+        )
+
+    def test_sentence_delete(self):
+        self.assert_resume_is_equivalent(
+            mode=TextSynthesis.SENTENCE, synthesis_mode=TextSynthesis.SYNTHESIS_DELETE, p_value_level=0.0001
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import os
+import sys
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from http_transcription import HttpPhonemeParser  # noqa: E402
+
+
+class TranscriptionServer(ThreadingHTTPServer):
+    """
+    Local stand-in of the transcription site. Transcription of a word is the word in upper case. The first failures
+    requests get failure_status, and texts of more than one word get one phoneme less when merge_batches is set.
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), TranscriptionHandler)
+        self.lock = threading.Lock()
+        self.texts = []
+        self.failures = 0
+        self.failure_status = 500
+        self.merge_batches = False
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}/phon.php'.format(self.server_address[1])
+
+
+class TranscriptionHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8')
+        text = parse_qs(body)['intext'][0]
+        with self.server.lock:
+            self.server.texts.append(text)
+            failed = self.server.failures > 0
+            if failed:
+                self.server.failures -= 1
+
+        if failed:
+            self.send_response(self.server.failure_status)
+            self.end_headers()
+            return
+
+        phonemes = text.upper().split()
+        if self.server.merge_batches and len(phonemes) > 1:
+            phonemes = [phonemes[0] + phonemes[1]] + phonemes[2:]
+        html = '<table><tr><td>{}</td><td><font> {} </font></td></tr></table>'.format(text, ' '.join(phonemes))
+        data = html.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class HttpPhonemeParserTest(unittest.TestCase):
+    WORDS = ['one', 'two', 'three', 'four', 'five']
+
+    def setUp(self):
+        self.server = TranscriptionServer()
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.parser = HttpPhonemeParser(url=self.server.url, workers=2)
+        self.parser.BATCH_SIZE = 2
+        self.parser.BACKOFF = 0
+
+    def tearDown(self):
+        self.parser.session.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def test_batches(self):
+        phonemes = list(self.parser.words_to_phonemes(self.WORDS))
+        self.assertEqual(phonemes, [(word, word.upper()) for word in self.WORDS])
+        self.assertEqual(sorted(self.server.texts), ['five', 'one two', 'three four'])
+
+    def test_retries_server_errors(self):
+        self.server.failures = self.parser.RETRIES
+        self.assertEqual(self.parser.text_to_phoneme('one two'), 'ONE TWO')
+        self.assertEqual(self.server.texts, ['one two'] * (self.parser.RETRIES + 1))
+
+    def test_raises_when_retries_are_exhausted(self):
+        self.server.failures = self.parser.RETRIES + 1
+        with self.assertRaises(requests.HTTPError):
+            self.parser.text_to_phoneme('one')
+        self.assertEqual(len(self.server.texts), self.parser.RETRIES + 1)
+
+    def test_client_errors_are_not_retried(self):
+        self.server.failures = 1
+        self.server.failure_status = 404
+        with self.assertRaises(requests.HTTPError):
+            self.parser.text_to_phoneme('one')
+        self.assertEqual(len(self.server.texts), 1)
+
+    def test_batch_falls_back_to_single_words(self):
+        self.server.merge_batches = True
+        phonemes = list(self.parser.words_to_phonemes(self.WORDS[:2]))
+        self.assertEqual(phonemes, [('one', 'ONE'), ('two', 'TWO')])
+        self.assertEqual(self.server.texts, ['one two', 'one', 'two'])
+
+
+if __name__ == '__main__':
+    unittest.main()
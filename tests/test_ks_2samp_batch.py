@@ -0,0 +1,56 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+from scipy import stats
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from phoneme_parser import ks_2samp_batch  # noqa: E402
+
+
+class KS2SampBatchTest(unittest.TestCase):
+    def assert_matches_scipy(self, values_initial, values_chunks):
+        statistics, pvalues = ks_2samp_batch(values_initial, values_chunks)
+        self.assertEqual(statistics.shape, (len(values_chunks),))
+        self.assertEqual(pvalues.shape, (len(values_chunks),))
+        for row, statistic, pvalue in zip(values_chunks, statistics, pvalues):
+            expected = stats.ks_2samp(values_initial, row)
+            self.assertAlmostEqual(statistic, expected.statistic, places=9)
+            self.assertAlmostEqual(pvalue, expected.pvalue, places=9)
+
+    def test_random_values(self):
+        random = np.random.RandomState(0)
+        self.assert_matches_scipy(random.rand(40), random.rand(30, 40))
+
+    def test_ties(self):
+        random = np.random.RandomState(1)
+        values_chunks = random.randint(0, 4, size=(30, 25)).astype(np.float64)
+        values_chunks[0] = 0
+        self.assert_matches_scipy(random.randint(0, 4, size=25).astype(np.float64), values_chunks)
+
+    def test_identical_rows(self):
+        values_initial = np.linspace(0, 1, 10)
+        statistics, pvalues = ks_2samp_batch(values_initial, np.tile(values_initial, (3, 1)))
+        np.testing.assert_array_equal(statistics, 0)
+        np.testing.assert_allclose(pvalues, 1)
+
+    def test_rows_in_several_blocks(self):
+        import phoneme_parser
+        batch_size = phoneme_parser.KS_BATCH_SIZE
+        phoneme_parser.KS_BATCH_SIZE = 60
+        try:
+            random = np.random.RandomState(2)
+            self.assert_matches_scipy(random.rand(20), random.rand(7, 20))
+        finally:
+            phoneme_parser.KS_BATCH_SIZE = batch_size
+
+    def test_empty_values(self):
+        statistics, pvalues = ks_2samp_batch([], np.zeros((2, 0)))
+        np.testing.assert_array_equal(statistics, 0)
+        np.testing.assert_array_equal(pvalues, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
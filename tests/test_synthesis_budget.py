@@ -0,0 +1,64 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from helpers import APP_DIR, OfflinePhonemeParser
+from phoneme_parser import SavedPhonemeWords, TextBlocks, TextSynthesis
+
+
+class BudgetBestResultTest(unittest.TestCase):
+    """
+    Append synthesis stopped by a budget returns the best picks so far, never the empty text, also when every p-value
+    underflows to 0.
+    """
+    ITERATIONS = 10
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        cls.file_name = SavedPhonemeWords.FILE_NAME
+        SavedPhonemeWords.FILE_NAME = os.path.join(cls.directory, 'saved_phonemes.sqlite3')
+        cls.text_analyzer = TextSynthesis.analyze(
+            TextBlocks(os.path.join(APP_DIR, 'file.txt')), OfflinePhonemeParser(), 1
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        SavedPhonemeWords.FILE_NAME = cls.file_name
+        shutil.rmtree(cls.directory)
+
+    def synthesize_with_zero_p_values(self, criteria):
+        text_synth = TextSynthesis(
+            text=None, text_analyzer=self.text_analyzer, mode=TextSynthesis.WORD,
+            distribution_criteria=criteria, max_iterations=self.ITERATIONS
+        )
+        statistics = []
+        get_ks_test = text_synth.get_ks_test
+
+        def get_underflowed_ks_test(text_counts):
+            statistic, _ = get_ks_test(text_counts)
+            statistics.append(statistic)
+            return statistic, 0.0
+
+        text_synth.get_ks_test = get_underflowed_ks_test
+        text_synth.synthesis()
+        return text_synth, statistics
+
+    def assert_lowest_statistic_is_kept(self, criteria):
+        text_synth, statistics = self.synthesize_with_zero_p_values(criteria)
+        self.assertTrue(text_synth.budget_exhausted)
+        # statistics[i] is of the first i picks, the empty text is never a result
+        best_picks_number = min(range(1, len(statistics)), key=lambda picks_number: statistics[picks_number])
+        self.assertEqual(len(text_synth.picked_chunks), best_picks_number)
+        self.assertTrue(text_synth.result_text)
+
+    def test_pvalue_ties_are_broken_by_statistic(self):
+        self.assert_lowest_statistic_is_kept(TextSynthesis.PVALUE)
+
+    def test_statistic_criteria(self):
+        self.assert_lowest_statistic_is_kept(TextSynthesis.STATISTIC)
+
+
+if __name__ == '__main__':
+    unittest.main()